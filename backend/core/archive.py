@@ -0,0 +1,460 @@
+"""Cold storage for old events in compressed columnar segment files.
+
+`EventStore.archive_events` moves events past the retention window out of
+the `events` table into immutable segment files, partitioned by UTC day:
+
+    <archive_dir>/2024-05-01/<first timestamp>-<suffix>.seg
+
+A segment holds up to `SEGMENT_ROWS` events sorted by timestamp, one
+zlib-compressed column at a time, so a query only decompresses the columns
+it needs: timestamps and type/user codes to find matches, then ids, data
+and correlation ids for the matching rows only. Those variable-length
+columns are compressed in blocks of `BLOCK_ROWS`, so a handful of matches
+only inflates the blocks they fall in. Files are read through
+mmap, and `index.json` keeps a per-segment summary (time range, event types,
+users) so most segments are ruled out without being opened.
+
+Several workers or replicas may share one archive directory. Index updates
+re-read `index.json` and merge under an exclusive file lock, readers reload
+the index when it changes on disk, and `compaction_lock()` lets only one
+process at a time move rows out of the table.
+
+Layout: MAGIC, a 4-byte little-endian header length, the JSON header
+(row count, time range and the offset/length of each column part), then the
+compressed column parts.
+"""
+import bisect
+import itertools
+import mmap
+import os
+import struct
+import uuid
+import zlib
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from core.serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single process only
+    fcntl = None
+
+MAGIC = b"EVSEG1\n"
+HEADER_LENGTH = struct.Struct("<I")
+INDEX_FILE = "index.json"
+INDEX_LOCK_FILE = ".index.lock"
+COMPACTION_LOCK_FILE = ".compaction.lock"
+
+SEGMENT_ROWS = 100_000
+BLOCK_ROWS = 1024
+COMPRESSION_LEVEL = 6
+# Segments with more distinct users than this are indexed as "any user"
+INDEX_MAX_USERS = 1000
+# Marks None in variable-length columns; never valid UTF-8 or JSON
+NULL = b"\xff"
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_micros(timestamp: datetime) -> int:
+    """Naive UTC datetime (as stored by EventStore) to epoch microseconds"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _encode_values(values: Sequence[Optional[bytes]]) -> List[bytes]:
+    """Parts of a variable-length column, one per BLOCK_ROWS rows
+
+    Each part is the block's offsets (uint32, rows + 1) followed by the
+    concatenated values.
+    """
+    parts = []
+    for start in range(0, len(values), BLOCK_ROWS):
+        offsets = array("I", [0])
+        payload = bytearray()
+        for value in values[start:start + BLOCK_ROWS]:
+            payload += NULL if value is None else value
+            offsets.append(len(payload))
+        parts.append(offsets.tobytes() + payload)
+    return parts
+
+
+def _encode_dictionary(values: Sequence[Optional[str]]):
+    """Dictionary and codes of a low-cardinality column"""
+    dictionary: Dict[Optional[str], int] = {}
+    codes = array("I", (dictionary.setdefault(value, len(dictionary)) for value in values))
+    return list(dictionary), [codes.tobytes()]
+
+
+class Segment:
+    """One segment file, opened through mmap for the duration of a read"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an event segment")
+        start = len(MAGIC) + HEADER_LENGTH.size
+        (length,) = HEADER_LENGTH.unpack_from(self._map, len(MAGIC))
+        self.header = loads(self._map[start:start + length])
+        self._base = start + length
+        self._parts: Dict[tuple, bytes] = {}
+
+    def part(self, column: str, index: int = 0) -> bytes:
+        """Decompressed column part; only the pages it spans are read"""
+        key = (column, index)
+        if key not in self._parts:
+            offset, length = self.header["columns"][column]["parts"][index]
+            self._parts[key] = zlib.decompress(self._map[self._base + offset:self._base + offset + length])
+        return self._parts[key]
+
+    def ints(self, column: str, typecode: str) -> array:
+        values = array(typecode)
+        values.frombytes(self.part(column))
+        return values
+
+    def values(self, column: str, rows: Sequence[int]) -> List[Optional[bytes]]:
+        """Values of a variable-length column at `rows`, inflating only their blocks"""
+        block_rows = self.header["block_rows"]
+        blocks: Dict[int, tuple] = {}
+        values = []
+        for row in rows:
+            block, index = divmod(row, block_rows)
+            if block not in blocks:
+                raw = self.part(column, block)
+                count = min(block_rows, self.header["rows"] - block * block_rows)
+                offsets = array("I")
+                offsets.frombytes(raw[:offsets.itemsize * (count + 1)])
+                blocks[block] = (offsets, offsets.itemsize * (count + 1), raw)
+            offsets, base, raw = blocks[block]
+            value = raw[base + offsets[index]:base + offsets[index + 1]]
+            values.append(None if value == NULL else value)
+        return values
+
+    def dictionary(self, column: str) -> List[Optional[str]]:
+        return self.header["columns"][column]["values"]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def write_segment(path: str, events: Sequence[Dict[str, Any]]):
+    """Write events (dicts sorted by timestamp) as one segment file"""
+    timestamps = array("q", (to_micros(e["timestamp"]) for e in events))
+    types, type_parts = _encode_dictionary([e["type"] for e in events])
+    users, user_parts = _encode_dictionary([e["user_id"] for e in events])
+    columns = {
+        "timestamp": ({"kind": "i64"}, [timestamps.tobytes()]),
+        "type": ({"kind": "dictionary", "values": types}, type_parts),
+        "user_id": ({"kind": "dictionary", "values": users}, user_parts),
+        "id": ({"kind": "bytes"}, _encode_values([e["id"].encode() for e in events])),
+        "correlation_id": ({"kind": "bytes"}, _encode_values([
+            None if e["correlation_id"] is None else e["correlation_id"].encode() for e in events
+        ])),
+        "data": ({"kind": "bytes"}, _encode_values([dumps(e["data"]) for e in events])),
+    }
+
+    header: Dict[str, Any] = {
+        "rows": len(events),
+        "min_ts": timestamps[0],
+        "max_ts": timestamps[-1],
+        "block_rows": BLOCK_ROWS,
+        "columns": {},
+    }
+    blobs = []
+    offset = 0
+    for name, (meta, parts) in columns.items():
+        meta["parts"] = []
+        for part in parts:
+            blob = zlib.compress(part, COMPRESSION_LEVEL)
+            meta["parts"].append([offset, len(blob)])
+            blobs.append(blob)
+            offset += len(blob)
+        header["columns"][name] = meta
+
+    encoded = dumps(header)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(encoded)))
+        f.write(encoded)
+        for blob in blobs:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def index_entry(path: str, root: str) -> Dict[str, Any]:
+    """Index summary of a segment, read from its header"""
+    with Segment(path) as segment:
+        header = segment.header
+        users = segment.dictionary("user_id")
+        return {
+            "file": os.path.relpath(path, root),
+            "rows": header["rows"],
+            "min_ts": header["min_ts"],
+            "max_ts": header["max_ts"],
+            "types": segment.dictionary("type"),
+            "users": users if len(users) <= INDEX_MAX_USERS else None,
+        }
+
+
+def _rows_with_code(codes: bytes, code: int, lo: int, hi: int) -> Iterator[int]:
+    """Rows in [lo, hi) whose dictionary code is `code`, newest first
+
+    Searches the raw code column with bytes.rfind, which runs in C, instead of
+    comparing row by row in Python.
+    """
+    needle = array("I", [code]).tobytes()
+    width = len(needle)
+    start, end = lo * width, hi * width
+    while True:
+        position = codes.rfind(needle, start, end)
+        if position < 0:
+            return
+        if position % width == 0:
+            yield position // width
+            end = position
+        else:
+            # Straddles two codes; keep looking to the left of it
+            end = position + width - 1
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    """Exclusive flock on `path`; yields False if `blocking` is off and another holder has it"""
+    with open(path, "a") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class EventArchive:
+    """Day-partitioned segment files with a min/max index"""
+
+    def __init__(self, root: str, segment_rows: int = SEGMENT_ROWS):
+        self.root = root
+        self.segment_rows = segment_rows
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._index_stamp = None
+        self.segments: List[Dict[str, Any]] = []
+        with _file_lock(os.path.join(root, INDEX_LOCK_FILE)):
+            if not self._read_index():
+                self._rebuild_locked()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read_index(self) -> bool:
+        """Load index.json as written by any process; False when there is none"""
+        try:
+            stamp = self._stamp()
+            with open(self.index_path, "rb") as f:
+                self.segments = loads(f.read())
+        except FileNotFoundError:
+            return False
+        self._index_stamp = stamp
+        return True
+
+    def refresh(self):
+        """Pick up segments other processes added since the index was read"""
+        if self._stamp() != self._index_stamp:
+            self._read_index()
+
+    @contextmanager
+    def compaction_lock(self) -> Iterator[bool]:
+        """Held while moving rows into the archive; yields False if another process is compacting"""
+        with _file_lock(os.path.join(self.root, COMPACTION_LOCK_FILE), blocking=False) as acquired:
+            yield acquired
+
+    def rebuild_index(self) -> List[Dict[str, Any]]:
+        """Re-read every segment header, e.g. after the index was lost"""
+        with _file_lock(os.path.join(self.root, INDEX_LOCK_FILE)):
+            return self._rebuild_locked()
+
+    def _rebuild_locked(self) -> List[Dict[str, Any]]:
+        segments = []
+        for directory, _, files in os.walk(self.root):
+            for name in sorted(files):
+                if name.endswith(".seg"):
+                    try:
+                        segments.append(index_entry(os.path.join(directory, name), self.root))
+                    except (OSError, ValueError, zlib.error) as e:
+                        print(f"Skipping unreadable segment {name}: {e}")
+        self.segments = sorted(segments, key=lambda s: s["max_ts"])
+        self._save_index()
+        return self.segments
+
+    def _save_index(self):
+        with open(f"{self.index_path}.tmp", "wb") as f:
+            f.write(dumps(self.segments))
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+        self._index_stamp = self._stamp()
+
+    def write(self, events: Sequence[Dict[str, Any]]) -> int:
+        """Archive events (dicts with Event's fields); returns segments written"""
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for event in sorted(events, key=lambda e: e["timestamp"]):
+            by_day.setdefault(event["timestamp"].date().isoformat(), []).append(event)
+
+        added = []
+        for day, day_events in by_day.items():
+            os.makedirs(os.path.join(self.root, day), exist_ok=True)
+            for start in range(0, len(day_events), self.segment_rows):
+                chunk = day_events[start:start + self.segment_rows]
+                name = f"{to_micros(chunk[0]['timestamp'])}-{uuid.uuid4().hex[:8]}.seg"
+                path = os.path.join(self.root, day, name)
+                write_segment(path, chunk)
+                added.append(index_entry(path, self.root))
+
+        if added:
+            with _file_lock(os.path.join(self.root, INDEX_LOCK_FILE)):
+                # Merge into the index as it is on disk now, which may hold
+                # segments other processes wrote since we last read it
+                self._read_index()
+                known = {s["file"] for s in self.segments}
+                # Readers may be iterating the old list; swap in a new one
+                self.segments = sorted(
+                    self.segments + [a for a in added if a["file"] not in known], key=lambda s: s["max_ts"]
+                )
+                self._save_index()
+        return len(added)
+
+    def _may_match(self, entry, event_type, user_id, since_us, until_us) -> bool:
+        if since_us is not None and entry["max_ts"] < since_us:
+            return False
+        if until_us is not None and entry["min_ts"] > until_us:
+            return False
+        if event_type is not None and event_type not in entry["types"]:
+            return False
+        if user_id is not None and entry["users"] is not None and user_id not in entry["users"]:
+            return False
+        return True
+
+    def query(
+        self,
+        event_type: Optional[str] = None,
+        user_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = 100,
+        exclude_ids: Iterable[str] = (),
+    ) -> List[Dict[str, Any]]:
+        """Newest archived events matching the filters, newest first"""
+        self.refresh()
+        since_us = to_micros(since) if since else None
+        until_us = to_micros(until) if until else None
+        seen = set(exclude_ids)
+        # Rows found per segment; extra in case some are excluded duplicates
+        candidates = limit + len(seen)
+        results: List[Dict[str, Any]] = []
+
+        for entry in reversed(self.segments):
+            # Segments are ordered by max_ts, so once `limit` rows are newer
+            # than everything left, the rest can be skipped
+            if len(results) >= limit and entry["max_ts"] < results[limit - 1]["ts"]:
+                break
+            if not self._may_match(entry, event_type, user_id, since_us, until_us):
+                continue
+            results.extend(self._scan(entry, event_type, user_id, since_us, until_us, candidates, limit, seen))
+            results.sort(key=lambda r: r["ts"], reverse=True)
+            del results[limit:]
+
+        for row in results:
+            row["timestamp"] = from_micros(row.pop("ts"))
+        return results
+
+    def _scan(self, entry, event_type, user_id, since_us, until_us, candidates, limit, seen) -> List[Dict[str, Any]]:
+        with Segment(os.path.join(self.root, entry["file"])) as segment:
+            timestamps = segment.ints("timestamp", "q")
+            lo = bisect.bisect_left(timestamps, since_us) if since_us is not None else 0
+            hi = bisect.bisect_right(timestamps, until_us) if until_us is not None else len(timestamps)
+
+            # (column, code) pairs to match, most selective (user) first
+            checks = []
+            for column, wanted in (("user_id", user_id), ("type", event_type)):
+                if wanted is None:
+                    continue
+                dictionary = segment.dictionary(column)
+                if wanted not in dictionary:
+                    return []
+                checks.append((column, dictionary.index(wanted)))
+
+            if checks:
+                column, code = checks[0]
+                matching = _rows_with_code(segment.part(column), code, lo, hi)
+                for column, code in checks[1:]:
+                    codes = segment.ints(column, "I")
+                    matching = (row for row in matching if codes[row] == code)
+            else:
+                matching = iter(range(hi - 1, lo - 1, -1))
+            rows = list(itertools.islice(matching, candidates))
+            if not rows:
+                return []
+
+            ids = segment.values("id", rows)
+            types = segment.dictionary("type")
+            type_codes = segment.ints("type", "I")
+            users = segment.dictionary("user_id")
+            user_codes = segment.ints("user_id", "I")
+            correlation_ids = segment.values("correlation_id", rows)
+            data = segment.values("data", rows)
+
+        matches = []
+        for i, row in enumerate(rows):
+            event_id = ids[i].decode()
+            if event_id in seen:
+                continue
+            seen.add(event_id)
+            matches.append({
+                "id": event_id,
+                "type": types[type_codes[row]],
+                "data": loads(data[i]),
+                "ts": timestamps[row],
+                "user_id": users[user_codes[row]],
+                "correlation_id": None if correlation_ids[i] is None else correlation_ids[i].decode(),
+            })
+            if len(matches) >= limit:
+                break
+        return matches
+
+    def stats(self) -> Dict[str, Any]:
+        self.refresh()
+        return {
+            "segments": len(self.segments),
+            "events": sum(s["rows"] for s in self.segments),
+            "bytes": sum(os.path.getsize(os.path.join(self.root, s["file"])) for s in self.segments),
+        }
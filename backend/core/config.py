@@ -1,9 +1,14 @@
+from typing import List
+
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     # Redis
     redis_url: str = "redis://localhost:6379"
+    # Event types published to Redis by other services (the AI gateway) and
+    # relayed to local subscribers such as WebSocket clients
+    relay_event_types: List[str] = ["cost_rollup", "cost_anomaly"]
     
     # API
     api_title: str = "Event-Driven API"
@@ -17,6 +22,15 @@ class Settings(BaseSettings):
     # Environment
     environment: str = "development"
     debug: bool = True
+    # /debug/profile is unauthenticated; enable it only where the port is not exposed
+    profiling_enabled: bool = False
+    
+    # Event archive: events older than the retention window are moved from
+    # the events table to compressed segment files
+    archive_enabled: bool = True
+    archive_dir: str = "./archive"
+    archive_retention_days: float = 7.0
+    archive_compaction_interval_seconds: int = 3600
     
     class Config:
         env_file = ".env"
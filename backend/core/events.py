@@ -1,19 +1,21 @@
 import asyncio
-import json
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, List, Callable, Any, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 import redis.asyncio as redis
-from sqlalchemy import select, insert
+from sqlalchemy import delete, select, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.archive import EventArchive
 from core.config import settings
 from core.database import AsyncSessionLocal
+from core.instrumentation import span
+from core.serialization import dumps, loads
 from models.events import Event as EventModel
 
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     """Event data structure"""
     id: str
@@ -22,6 +24,17 @@ class Event:
     timestamp: datetime
     user_id: Optional[str] = None
     correlation_id: Optional[str] = None
+    _encoded: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
+    
+    def to_json(self) -> bytes:
+        """Encode once; the bytes are reused for Redis and WebSocket fan-out.
+
+        Events are treated as immutable after publishing, so the cached
+        encoding is never invalidated.
+        """
+        if self._encoded is None:
+            self._encoded = dumps(self.to_dict())
+        return self._encoded
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -57,18 +70,20 @@ class EventBus:
     
     async def publish(self, event: Event):
         """Publish an event to all subscribers"""
-        # Local subscribers
-        await self._notify_local_subscribers(event)
-        
-        # Redis pub/sub for distributed systems
-        if self.redis_client:
-            try:
-                await self.redis_client.publish(
-                    f"events:{event.type}",
-                    json.dumps(event.to_dict())
-                )
-            except Exception as e:
-                print(f"Redis publish failed: {e}")
+        with span("event_publish"):
+            # Local subscribers
+            await self._notify_local_subscribers(event)
+            
+            # Redis pub/sub for distributed systems
+            if self.redis_client:
+                try:
+                    with span("redis_publish"):
+                        await self.redis_client.publish(
+                            f"events:{event.type}",
+                            event.to_json()
+                        )
+                except Exception as e:
+                    print(f"Redis publish failed: {e}")
     
     async def _notify_local_subscribers(self, event: Event):
         """Notify local subscribers"""
@@ -94,6 +109,48 @@ class EventBus:
                 except Exception as e:
                     print(f"Wildcard event handler error: {e}")
     
+    async def relay_remote(self, event_types: List[str]):
+        """Deliver events other services publish to Redis to local subscribers
+        
+        Only list types this process does not publish itself (e.g. the
+        gateway's cost_rollup and cost_anomaly), or they are delivered twice.
+        """
+        if not self.redis_client or not event_types:
+            return
+        
+        channels = [f"events:{event_type}" for event_type in event_types]
+        delay = 1.0
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(*channels)
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        payload = loads(message["data"])
+                        event = Event(
+                            id=payload["id"],
+                            type=payload["type"],
+                            data=payload["data"],
+                            timestamp=datetime.fromisoformat(payload["timestamp"]),
+                            user_id=payload.get("user_id"),
+                            correlation_id=payload.get("correlation_id")
+                        )
+                    except (ValueError, KeyError, TypeError) as e:
+                        print(f"Dropping malformed remote event: {e}")
+                        continue
+                    await self._notify_local_subscribers(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Remote event relay failed, retrying in {delay:.0f}s: {e}")
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+    
     async def close(self):
         """Close Redis connection"""
         if self.redis_client:
@@ -101,7 +158,18 @@ class EventBus:
 
 
 class EventStore:
-    """Event store for persisting events"""
+    """Event store for persisting events
+    
+    Recent events live in the `events` table; with an archive attached,
+    `archive_events` moves older ones to compressed segment files and
+    `get_events` reads both transparently.
+    """
+    
+    # SQLite's default limit on bound parameters is 999 on older builds
+    DELETE_CHUNK = 500
+    
+    def __init__(self, archive: Optional[EventArchive] = None):
+        self.archive = archive
     
     async def save_event(self, event: Event):
         """Save event to database"""
@@ -116,7 +184,8 @@ class EventStore:
                     correlation_id=event.correlation_id
                 )
                 session.add(event_model)
-                await session.commit()
+                with span("db_commit"):
+                    await session.commit()
             except Exception as e:
                 await session.rollback()
                 raise e
@@ -125,9 +194,11 @@ class EventStore:
         self,
         event_type: Optional[str] = None,
         user_id: Optional[str] = None,
-        limit: int = 100
+        limit: int = 100,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
     ) -> List[Event]:
-        """Retrieve events from database"""
+        """Retrieve the newest matching events, from the database and then the archive"""
         async with AsyncSessionLocal() as session:
             query = select(EventModel)
             
@@ -135,23 +206,107 @@ class EventStore:
                 query = query.where(EventModel.type == event_type)
             if user_id:
                 query = query.where(EventModel.user_id == user_id)
+            if since:
+                query = query.where(EventModel.timestamp >= since)
+            if until:
+                query = query.where(EventModel.timestamp <= until)
             
             query = query.order_by(EventModel.timestamp.desc()).limit(limit)
             
             result = await session.execute(query)
-            events = result.scalars().all()
-            
-            return [
-                Event(
-                    id=e.id,
-                    type=e.type,
-                    data=e.data,
-                    timestamp=e.timestamp,
-                    user_id=e.user_id,
-                    correlation_id=e.correlation_id
+            events = [self._from_model(e) for e in result.scalars().all()]
+        
+        if self.archive is None or len(events) >= limit:
+            return events
+        
+        # Archived events are older than everything still in the table
+        with span("archive_query"):
+            archived = await asyncio.to_thread(
+                self.archive.query,
+                event_type=event_type,
+                user_id=user_id,
+                since=since,
+                until=until,
+                limit=limit - len(events),
+                exclude_ids=[e.id for e in events]
+            )
+        return events + [Event(**row) for row in archived]
+    
+    async def archive_events(self, older_than: datetime, batch_rows: int = 100_000) -> int:
+        """Move events older than `older_than` into the archive; returns events moved
+        
+        Rows are deleted only after their segment is written, so a crash in
+        between leaves duplicates, which reads skip, rather than losing events.
+        Returns 0 without doing anything while another process sharing the
+        archive directory is compacting.
+        """
+        if self.archive is None:
+            return 0
+        
+        with self.archive.compaction_lock() as acquired:
+            if not acquired:
+                return 0
+            return await self._archive_batches(older_than, batch_rows)
+    
+    async def _archive_batches(self, older_than: datetime, batch_rows: int) -> int:
+        moved = 0
+        while True:
+            async with AsyncSessionLocal() as session:
+                query = (
+                    select(EventModel)
+                    .where(EventModel.timestamp < older_than)
+                    .order_by(EventModel.timestamp)
+                    .limit(batch_rows)
                 )
-                for e in events
-            ]
+                rows = (await session.execute(query)).scalars().all()
+                if not rows:
+                    break
+                
+                batch = [
+                    {
+                        "id": e.id,
+                        "type": e.type,
+                        "data": e.data,
+                        "timestamp": e.timestamp,
+                        "user_id": e.user_id,
+                        "correlation_id": e.correlation_id
+                    }
+                    for e in rows
+                ]
+                await asyncio.to_thread(self.archive.write, batch)
+                
+                ids = [e.id for e in rows]
+                for start in range(0, len(ids), self.DELETE_CHUNK):
+                    await session.execute(delete(EventModel).where(EventModel.id.in_(ids[start:start + self.DELETE_CHUNK])))
+                await session.commit()
+            
+            moved += len(rows)
+            if len(rows) < batch_rows:
+                break
+        return moved
+    
+    @staticmethod
+    def _from_model(e: EventModel) -> Event:
+        return Event(
+            id=e.id,
+            type=e.type,
+            data=e.data,
+            timestamp=e.timestamp,
+            user_id=e.user_id,
+            correlation_id=e.correlation_id
+        )
+
+
+async def run_archive_compaction(store: EventStore, retention: timedelta, interval_seconds: float):
+    """Periodically move events past the retention window into the archive"""
+    while True:
+        try:
+            moved = await store.archive_events(datetime.utcnow() - retention)
+            if moved:
+                print(f"Archived {moved} events older than {retention}")
+        except Exception as e:
+            print(f"Event archive compaction failed: {e}")
+        await asyncio.sleep(interval_seconds)
 
 
 def create_event(
@@ -1,7 +1,13 @@
-import json
 from typing import List, Dict, Set
 from fastapi import WebSocket
 from core.events import Event
+from core.instrumentation import span
+from core.serialization import dumps_str
+
+
+def event_message(event: Event) -> str:
+    """Wrap an event's cached encoding in the broadcast envelope"""
+    return '{"type":"event","event":' + event.to_json().decode() + '}'
 
 
 class ConnectionManager:
@@ -28,7 +34,7 @@ class ConnectionManager:
         """Subscribe a connection to specific event types"""
         if websocket in self.subscriptions:
             self.subscriptions[websocket].update(event_types)
-            await websocket.send_text(json.dumps({
+            await websocket.send_text(dumps_str({
                 "type": "subscription_confirmed",
                 "event_types": list(self.subscriptions[websocket])
             }))
@@ -55,20 +61,18 @@ class ConnectionManager:
     
     async def broadcast_event(self, event: Event):
         """Broadcast an event to subscribed connections"""
-        event_data = json.dumps({
-            "type": "event",
-            "event": event.to_dict()
-        })
+        event_data = event_message(event)
         
         disconnected = []
-        for connection in self.active_connections:
-            # Check if connection is subscribed to this event type
-            subscriptions = self.subscriptions.get(connection, set())
-            if not subscriptions or event.type in subscriptions or "*" in subscriptions:
-                try:
-                    await connection.send_text(event_data)
-                except Exception:
-                    disconnected.append(connection)
+        with span("broadcast"):
+            for connection in self.active_connections:
+                # Check if connection is subscribed to this event type
+                subscriptions = self.subscriptions.get(connection, set())
+                if not subscriptions or event.type in subscriptions or "*" in subscriptions:
+                    try:
+                        await connection.send_text(event_data)
+                    except Exception:
+                        disconnected.append(connection)
         
         # Clean up disconnected connections
         for connection in disconnected:
@@ -1,32 +1,54 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from contextlib import asynccontextmanager
 import json
 import asyncio
+from datetime import timedelta
 from typing import List
 
+from core import instrumentation
 from core.config import settings
 from core.database import engine, Base
-from core.events import EventBus, EventStore
+from core.archive import EventArchive
+from core.events import EventBus, EventStore, run_archive_compaction
 from core.websocket import ConnectionManager
 from api.routes import events, users, tasks
-from models.events import Event
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    instrumentation.init("backend")
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     
     # Initialize event bus and store
     app.state.event_bus = EventBus()
-    app.state.event_store = EventStore()
+    archive = EventArchive(settings.archive_dir) if settings.archive_enabled else None
+    app.state.event_store = EventStore(archive=archive)
     app.state.connection_manager = ConnectionManager()
     
+    # Broadcast every event, local or relayed, to subscribed WebSocket clients.
+    # Registered here because on_event handlers do not run with a lifespan.
+    app.state.event_bus.subscribe("*", app.state.connection_manager.broadcast_event)
+    
+    relay = asyncio.create_task(app.state.event_bus.relay_remote(settings.relay_event_types))
+    compaction = None
+    if archive:
+        compaction = asyncio.create_task(run_archive_compaction(
+            app.state.event_store,
+            timedelta(days=settings.archive_retention_days),
+            settings.archive_compaction_interval_seconds
+        ))
+    
     yield
     
     # Shutdown
+    relay.cancel()
+    if compaction:
+        compaction.cancel()
     await app.state.event_bus.close()
 
 
@@ -62,6 +84,24 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    """Sample all thread stacks and return them in collapsed (flamegraph) format"""
+    if not settings.profiling_enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    try:
+        return await instrumentation.profile(seconds, interval_ms / 1000)
+    except instrumentation.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await app.state.connection_manager.connect(websocket)
@@ -91,15 +131,3 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         app.state.connection_manager.disconnect(websocket)
 
-
-# Event handlers
-@app.on_event("startup")
-async def setup_event_handlers():
-    """Setup event handlers for real-time notifications"""
-    
-    async def broadcast_event(event: Event):
-        """Broadcast events to connected WebSocket clients"""
-        await app.state.connection_manager.broadcast_event(event)
-    
-    # Subscribe to all events for broadcasting
-    app.state.event_bus.subscribe("*", broadcast_event)
\ No newline at end of file
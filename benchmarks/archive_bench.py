@@ -0,0 +1,205 @@
+"""Event history benchmark: one SQLite table vs hot table + columnar archive.
+
+Generates a synthetic history (default 10M events over 90 days) into
+- flat: every event in an SQLite `events` table, as EventStore kept them
+- tiered: the last --hot-days in SQLite, everything older in an EventArchive
+
+and times the EventStore.get_events query shapes against both, plus a
+single-event insert and the on-disk size. The tiered queries union the hot
+table with the archive the same way EventStore.get_events does.
+
+Usage:
+    python benchmarks/archive_bench.py [--events 10000000] [--days 90] [--hot-days 7] [--workdir DIR]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from core.archive import SEGMENT_ROWS, EventArchive  # noqa: E402
+from core.serialization import dumps, loads  # noqa: E402
+
+# Same columns and indexes as the events model
+SCHEMA = """
+CREATE TABLE events (
+    id VARCHAR NOT NULL PRIMARY KEY,
+    type VARCHAR,
+    data JSON,
+    timestamp DATETIME,
+    user_id VARCHAR,
+    correlation_id VARCHAR
+);
+CREATE INDEX ix_events_type ON events (type);
+CREATE INDEX ix_events_timestamp ON events (timestamp);
+"""
+
+# Skewed so that "budget_exceeded" is rare (~0.1%)
+EVENT_TYPES = ["task_updated"] * 60 + ["metrics_updated"] * 30 + ["user_login"] * 9 + ["budget_exceeded"] * 1
+USERS = 10_000
+
+
+def sql_time(timestamp: datetime) -> str:
+    # SQLAlchemy's SQLite DateTime storage format
+    return timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def generate(events: int, days: int, end: datetime):
+    """Yield chunks of event dicts in timestamp order"""
+    rng = random.Random(42)
+    start = end - timedelta(days=days)
+    step = timedelta(days=days) / events
+    for first in range(0, events, SEGMENT_ROWS):
+        chunk = []
+        for i in range(first, min(first + SEGMENT_ROWS, events)):
+            chunk.append({
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "type": rng.choice(EVENT_TYPES),
+                "data": {"task_id": i, "status": "completed", "progress": round(rng.random(), 3)},
+                "timestamp": start + step * i,
+                "user_id": f"user-{rng.randrange(USERS)}",
+                "correlation_id": None if i % 3 else str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            })
+        yield chunk
+
+
+def insert_rows(db: sqlite3.Connection, chunk):
+    db.executemany(
+        "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (e["id"], e["type"], dumps(e["data"]).decode(), sql_time(e["timestamp"]), e["user_id"], e["correlation_id"])
+            for e in chunk
+        ],
+    )
+
+
+def build(workdir: str, events: int, days: int, hot_days: int):
+    end = datetime(2024, 6, 30)
+    hot_cutoff = end - timedelta(days=hot_days)
+    flat = sqlite3.connect(os.path.join(workdir, "flat.db"))
+    hot = sqlite3.connect(os.path.join(workdir, "hot.db"))
+    for db in (flat, hot):
+        db.executescript(SCHEMA)
+    archive = EventArchive(os.path.join(workdir, "archive"))
+
+    started = time.perf_counter()
+    archive_seconds = 0.0
+    for chunk in generate(events, days, end):
+        insert_rows(flat, chunk)
+        cold = [e for e in chunk if e["timestamp"] < hot_cutoff]
+        if cold:
+            t = time.perf_counter()
+            archive.write(cold)
+            archive_seconds += time.perf_counter() - t
+        if len(cold) < len(chunk):
+            insert_rows(hot, chunk[len(cold):])
+    for db in (flat, hot):
+        db.commit()
+    print(f"Generated {events:,} events in {time.perf_counter() - started:.0f}s "
+          f"(archive writes {archive_seconds:.1f}s, {events / max(archive_seconds, 1e-9) / 1000:.0f}k events/s)")
+    return flat, hot, archive, end
+
+
+def get_events(db, archive, event_type=None, user_id=None, since=None, until=None, limit=100):
+    """EventStore.get_events against a raw connection (and archive, when tiered)"""
+    clauses, params = [], []
+    if event_type:
+        clauses.append("type = ?")
+        params.append(event_type)
+    if user_id:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if since:
+        clauses.append("timestamp >= ?")
+        params.append(sql_time(since))
+    if until:
+        clauses.append("timestamp <= ?")
+        params.append(sql_time(until))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = db.execute(f"SELECT * FROM events {where} ORDER BY timestamp DESC LIMIT ?", params + [limit]).fetchall()
+    events = [
+        {"id": r[0], "type": r[1], "data": loads(r[2]), "timestamp": datetime.fromisoformat(r[3]), "user_id": r[4], "correlation_id": r[5]}
+        for r in rows
+    ]
+    if archive is None or len(events) >= limit:
+        return events
+    return events + archive.query(
+        event_type=event_type, user_id=user_id, since=since, until=until,
+        limit=limit - len(events), exclude_ids=[e["id"] for e in events]
+    )
+
+
+def timed(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def file_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Event history archive benchmark")
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--hot-days", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workdir", help="Directory for the databases and archive (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="archive-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    flat, hot, archive, end = build(workdir, args.events, args.days, args.hot_days)
+    middle = end - timedelta(days=args.days / 2)
+
+    queries = {
+        "latest_100": {},
+        "rare_type_100": {"event_type": "budget_exceeded"},
+        "user_100": {"user_id": "user-42"},
+        "type_and_user_10": {"event_type": "user_login", "user_id": "user-42", "limit": 10},
+        "window_1h_1000": {"since": middle, "until": middle + timedelta(hours=1), "limit": 1000},
+    }
+
+    print(f"\n{'QUERY':<20} {'FLAT ms':>10} {'TIERED ms':>10} {'ROWS':>6}")
+    for name, params in queries.items():
+        expected = get_events(flat, None, **params)
+        actual = get_events(hot, archive, **params)
+        if [e["id"] for e in expected] != [e["id"] for e in actual]:
+            raise SystemExit(f"{name}: tiered results differ from the flat table")
+        flat_ms = timed(lambda: get_events(flat, None, **params), args.repeat)
+        tiered_ms = timed(lambda: get_events(hot, archive, **params), args.repeat)
+        print(f"{name:<20} {flat_ms:>10.2f} {tiered_ms:>10.2f} {len(actual):>6}")
+
+    def insert_one(db):
+        event = next(generate(1, 1, end + timedelta(days=1)))
+        event[0]["id"] = str(uuid.uuid4())
+        insert_rows(db, event)
+        db.commit()
+
+    print(f"{'insert_commit':<20} {timed(lambda: insert_one(flat), args.repeat):>10.2f} "
+          f"{timed(lambda: insert_one(hot), args.repeat):>10.2f}")
+
+    flat_bytes = file_size(os.path.join(workdir, "flat.db"))
+    hot_bytes = file_size(os.path.join(workdir, "hot.db"))
+    archive_bytes = archive.stats()["bytes"]
+    print(f"\nOn disk: flat {flat_bytes / 2**20:.0f} MB, tiered {hot_bytes / 2**20:.0f} MB hot + "
+          f"{archive_bytes / 2**20:.0f} MB archive ({len(archive.segments)} segments)")
+    print(f"Data left in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Reproducible performance benchmarks with regression gating.
+
+Runs each scenario from scenarios.py in a fresh interpreter (so RSS and
+Prometheus registries are per scenario), repeats it, keeps the median of
+each metric and writes the results as JSON. `compare` fails when a metric
+regressed past the threshold or a scenario started failing requests.
+
+Usage:
+    python benchmarks/run.py run --output results.json [--scenarios cold_cache ...]
+    python benchmarks/run.py compare baseline.json results.json --threshold 10
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from scenarios import DEFAULTS, SCENARIOS  # noqa: E402
+
+# Direction of each metric: +1 when higher is better, -1 when lower is better
+METRICS = {
+    "throughput_rps": 1,
+    "p50_ms": -1,
+    "p99_ms": -1,
+    "rss_mb": -1,
+}
+# Gated as the share of failed requests rather than relative change
+ERRORS = "errors"
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(name: str, requests: Optional[int], concurrency: Optional[int]) -> dict:
+    command = [sys.executable, os.path.join(HERE, "scenarios.py"), name]
+    if requests:
+        command += ["--requests", str(requests)]
+    if concurrency:
+        command += ["--concurrency", str(concurrency)]
+
+    completed = subprocess.run(command, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {"failed": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "no output"}
+    return json.loads(lines[-1])
+
+
+def median_of(runs: List[dict]) -> dict:
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    result["runs"] = len(runs)
+    return result
+
+
+def run(args) -> int:
+    scenarios = args.scenarios or list(SCENARIOS)
+    results: Dict[str, dict] = {}
+
+    for name in scenarios:
+        runs = []
+        for _ in range(args.repeat):
+            outcome = run_scenario(name, args.requests, args.concurrency)
+            if "skipped" in outcome or "failed" in outcome:
+                break
+            runs.append(outcome)
+
+        summary = results[name] = median_of(runs) if len(runs) == args.repeat else outcome
+        if "skipped" in summary or "failed" in summary:
+            print(f"{name:<22} {'SKIPPED' if 'skipped' in summary else 'FAILED'}: {summary.get('skipped') or summary.get('failed')}")
+        else:
+            print(
+                f"{name:<22} {summary['throughput_rps']:>10.1f} req/s  "
+                f"p50 {summary['p50_ms']:>8.2f} ms  p99 {summary['p99_ms']:>8.2f} ms  rss {summary['rss_mb']:>7.1f} MB"
+            )
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "defaults": {name: {"requests": r, "concurrency": c} for name, (r, c) in DEFAULTS.items()},
+        },
+        "scenarios": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    return 1 if any("failed" in r for r in results.values()) else 0
+
+
+def error_rate(result: dict) -> float:
+    """Failed requests in percent of all requests"""
+    return 100 * result.get("errors", 0) / result["requests"] if result.get("requests") else 0.0
+
+
+def compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)["scenarios"]
+    with open(args.current) as f:
+        current = json.load(f)["scenarios"]
+
+    regressions = []
+    print(f"{'SCENARIO':<22} {'METRIC':<15} {'BASELINE':>12} {'CURRENT':>12} {'CHANGE':>9}")
+    for name, base in baseline.items():
+        if "skipped" in base or "failed" in base:
+            continue
+        now = current.get(name)
+        # A scenario that measured before must still produce numbers
+        if now is None or "skipped" in now or "failed" in now:
+            status = "MISSING" if now is None else "SKIPPED" if "skipped" in now else "FAILED"
+            print(f"{name:<22} {'-':<15} {'':>12} {status:>12} {'':>9}  REGRESSION")
+            regressions.append(f"{name} ({status.lower()})")
+            continue
+        for metric, direction in METRICS.items():
+            if metric in args.ignore or not base.get(metric):
+                continue
+            change = (now[metric] - base[metric]) / base[metric] * 100
+            regressed = -change * direction > args.threshold
+            marker = "  REGRESSION" if regressed else ""
+            print(f"{name:<22} {metric:<15} {base[metric]:>12.2f} {now[metric]:>12.2f} {change:>+8.1f}%{marker}")
+            if regressed:
+                regressions.append(f"{name}.{metric}")
+        # Any errors where there were none, or an error rate up by more than
+        # the threshold in percentage points
+        if ERRORS not in args.ignore:
+            base_rate, now_rate = error_rate(base), error_rate(now)
+            regressed = now_rate - base_rate > args.threshold or (not base.get(ERRORS) and now.get(ERRORS, 0) > 0)
+            marker = "  REGRESSION" if regressed else ""
+            print(f"{name:<22} {'error_rate_%':<15} {base_rate:>12.2f} {now_rate:>12.2f} {now_rate - base_rate:>+7.1f}pt{marker}")
+            if regressed:
+                regressions.append(f"{name}.{ERRORS}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold}% or missing results: {', '.join(regressions)}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold}%")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Service performance benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run scenarios and write JSON results")
+    run_parser.add_argument("--scenarios", nargs="*", choices=sorted(SCENARIOS))
+    run_parser.add_argument("--requests", type=int, help="Override requests per scenario")
+    run_parser.add_argument("--concurrency", type=int, help="Override concurrency per scenario")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is kept")
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Fail when results regressed against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent")
+    compare_parser.add_argument("--ignore", nargs="*", default=[], choices=sorted([*METRICS, ERRORS]), help="Metrics not gated")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
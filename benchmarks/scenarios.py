@@ -0,0 +1,482 @@
+"""Benchmark scenarios, each run in its own interpreter by run.py.
+
+Services are loaded in-process from their source directories and driven
+through httpx's ASGI transport, with fakeredis standing in for Redis and a
+temporary SQLite file for the backend, so no containers are needed.
+
+Usage (normally invoked by run.py):
+    python benchmarks/scenarios.py <scenario> [--requests N] [--concurrency C]
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY_DIR = os.path.join(ROOT, "services", "ai-gateway-mock")
+INFERENCE_DIR = os.path.join(ROOT, "services", "inference-api")
+BACKEND_DIR = os.path.join(ROOT, "backend")
+
+# Simulated upstream latency is scaled down so scenarios measure gateway
+# overhead rather than asyncio.sleep.
+LATENCY_SCALE = 0.01
+
+
+class ScenarioSkipped(Exception):
+    pass
+
+
+def load_module(name: str, directory: str, filename: str = "main.py"):
+    """Import a service's module by path with its directory on sys.path"""
+    sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(directory, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    p99_index = max(0, int(round(0.99 * len(ordered))) - 1)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(ordered) * 1000, 3) if ordered else 0.0,
+        "p99_ms": round(ordered[p99_index] * 1000, 3) if ordered else 0.0,
+        "rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+async def drive(call: Callable[[int], Awaitable[bool]], requests: int, concurrency: int) -> Dict[str, float]:
+    """Run `call(i)` for every i with bounded concurrency, timing each call"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            ok = await call(i)
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def drive_at_rate(call: Callable[[int], Awaitable[bool]], requests: int, rate: float) -> Dict[str, float]:
+    """Start `call(i)` at a fixed arrival rate regardless of completions (open loop)"""
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        start = time.perf_counter()
+        ok = await call(i)
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(requests):
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i)))
+    await asyncio.gather(*tasks)
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def gateway_app():
+    """Load the gateway against fakeredis with scaled-down upstream latency"""
+    try:
+        import fakeredis
+    except ImportError:
+        raise ScenarioSkipped("fakeredis is not installed")
+
+    gateway = load_module("gateway_main", GATEWAY_DIR)
+    client = fakeredis.FakeRedis()
+    gateway.redis_client = client
+    gateway.CACHE_ENABLED = True
+    gateway.cache_writer = gateway.CacheWriteBatcher(client, on_error=gateway.store_in_memory)
+    for config in gateway.MODEL_CONFIGS.values():
+        config["latency_base"] *= LATENCY_SCALE
+        config["tokens_per_second"] /= LATENCY_SCALE
+    return gateway
+
+
+def chat_payload(prompt: str, model: str = "gpt-3.5-turbo") -> dict:
+    return {"model": model, "messages": [{"role": "user", "content": prompt}], "max_tokens": 100}
+
+
+async def scenario_cache_hit_storm(requests: int, concurrency: int) -> dict:
+    """Every request hits one of a few prewarmed cache entries"""
+    import httpx
+
+    gateway = gateway_app()
+    prompts = [f"Explain cloud cost optimization #{i}" for i in range(8)]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=gateway.app), base_url="http://gateway") as client:
+        # The exact requests the storm sends, so the prewarmed cache keys match
+        prewarm = "\n".join(json.dumps(chat_payload(prompt)) for prompt in prompts)
+        response = await client.post("/admin/cache/prewarm", content=prewarm)
+        if response.status_code != 200 or response.json()["written"] != len(prompts):
+            raise RuntimeError(f"cache prewarm failed: {response.status_code} {response.text}")
+
+        async def call(i: int) -> bool:
+            response = await client.post("/v1/chat/completions", json=chat_payload(prompts[i % len(prompts)]))
+            return response.status_code == 200 and response.json()["cached"]
+
+        return await drive(call, requests, concurrency)
+
+
+async def scenario_cold_cache(requests: int, concurrency: int) -> dict:
+    """Every request is a unique prompt, so each one misses and is written back"""
+    import httpx
+
+    gateway = gateway_app()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=gateway.app), base_url="http://gateway") as client:
+        async def call(i: int) -> bool:
+            response = await client.post("/v1/chat/completions", json=chat_payload(f"unique prompt {i}"))
+            return response.status_code == 200
+
+        result = await drive(call, requests, concurrency)
+        await gateway.cache_writer.flush()
+        return result
+
+
+# With LATENCY_SCALE a gpt-3.5-turbo call takes 5-45ms depending on
+# max_tokens (~20ms on average over the mix below), so two upstream slots
+# serve ~100 req/s and the default 400 req/s arrival rate is ~4x saturation.
+# Mixed output lengths make sure per-call latency differences are not
+# mistaken for overload.
+OVERLOAD_UPSTREAM_CONCURRENCY = 2
+OVERLOAD_DEADLINE_MS = 200
+OVERLOAD_MAX_TOKENS = (5, 50, 400)
+
+
+async def overload(requests: int, rate: int, limited: bool) -> dict:
+    """Unique prompts arriving past upstream capacity; only responses within the deadline count (goodput)
+
+    The scenario's concurrency setting is the arrival rate in requests per second.
+    """
+    import httpx
+
+    gateway = gateway_app()
+    gateway.CONCURRENCY_LIMIT_ENABLED = limited
+    gateway.TENANT_TIERS = {"tenant-0": "premium", "tenant-1": "free"}
+    for config in gateway.MODEL_CONFIGS.values():
+        config["upstream_concurrency"] = OVERLOAD_UPSTREAM_CONCURRENCY
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=gateway.app), base_url="http://gateway") as client:
+        async def call(i: int) -> bool:
+            payload = {
+                **chat_payload(f"overload prompt {i}"),
+                "enable_cache": False,
+                "tenant": f"tenant-{i % 3}",
+                "max_tokens": OVERLOAD_MAX_TOKENS[(i // 3) % len(OVERLOAD_MAX_TOKENS)],
+                "deadline_ms": OVERLOAD_DEADLINE_MS,
+            }
+            start = time.perf_counter()
+            response = await client.post("/v1/chat/completions", json=payload)
+            return response.status_code == 200 and time.perf_counter() - start <= OVERLOAD_DEADLINE_MS / 1000
+
+        return await drive_at_rate(call, requests, rate)
+
+
+async def scenario_overload_limited(requests: int, concurrency: int) -> dict:
+    return await overload(requests, concurrency, limited=True)
+
+
+async def scenario_overload_unlimited(requests: int, concurrency: int) -> dict:
+    return await overload(requests, concurrency, limited=False)
+
+
+async def scenario_inference_predict(requests: int, concurrency: int) -> dict:
+    import httpx
+
+    inference = load_module("inference_main", INFERENCE_DIR)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=inference.app), base_url="http://inference") as client:
+        async def call(i: int) -> bool:
+            response = await client.post("/predict", json={"text": f"sample input {i}"})
+            return response.status_code == 200
+
+        return await drive(call, requests, concurrency)
+
+
+def backend_modules():
+    """Import backend event modules against a temporary SQLite database"""
+    workdir = tempfile.mkdtemp(prefix="bench-backend-")
+    os.chdir(workdir)  # core.database uses ./events.db
+    os.environ.setdefault("SECRET_KEY", "benchmark-only")
+    os.environ.setdefault("DEBUG", "false")
+    os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1")
+    sys.path.insert(0, BACKEND_DIR)
+    try:
+        from core.database import Base, engine
+        ensure_event_model(Base)
+        from core import events, websocket
+    except ImportError as e:
+        raise ScenarioSkipped(f"backend not importable: {e}")
+    return events, websocket, Base, engine
+
+
+def ensure_event_model(Base):
+    """Register a minimal `models.events` when the backend tree does not ship one
+
+    Same columns and indexes as the events table the backend queries, so the
+    event scenarios measure core.events and core.websocket as deployed.
+    """
+    try:
+        import models.events  # noqa: F401
+        return
+    except ImportError:
+        pass
+    from sqlalchemy import JSON, Column, DateTime, String
+
+    class Event(Base):
+        __tablename__ = "events"
+        id = Column(String, primary_key=True)
+        type = Column(String, index=True)
+        data = Column(JSON)
+        timestamp = Column(DateTime, index=True)
+        user_id = Column(String, nullable=True)
+        correlation_id = Column(String, nullable=True)
+
+    package = types.ModuleType("models")
+    package.__path__ = []
+    module = types.ModuleType("models.events")
+    module.Event = Event
+    package.events = module
+    sys.modules["models"] = package
+    sys.modules["models.events"] = module
+
+
+class FakeWebSocket:
+    """Stands in for a Starlette WebSocket; only counts bytes sent"""
+
+    __slots__ = ("sent",)
+
+    def __init__(self):
+        self.sent = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        self.sent += len(message)
+
+
+async def scenario_event_burst(requests: int, concurrency: int) -> dict:
+    """Persist and publish a burst of events to local subscribers"""
+    events, websocket, Base, engine = backend_modules()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    bus = events.EventBus()
+    bus.redis_client = None  # local delivery only
+    store = events.EventStore()
+    manager = websocket.ConnectionManager()
+    for _ in range(50):
+        await manager.connect(FakeWebSocket())
+    bus.subscribe("*", manager.broadcast_event)
+
+    async def call(i: int) -> bool:
+        event = events.create_event("task_updated", {"task_id": i, "status": "completed"}, user_id=f"user-{i % 20}")
+        await store.save_event(event)
+        await bus.publish(event)
+        return True
+
+    return await drive(call, requests, concurrency)
+
+
+async def scenario_websocket_fanout(requests: int, concurrency: int) -> dict:
+    """Broadcast events to 5k connected WebSockets"""
+    events, websocket, _, _ = backend_modules()
+    manager = websocket.ConnectionManager()
+    for _ in range(5000):
+        await manager.connect(FakeWebSocket())
+
+    async def call(i: int) -> bool:
+        await manager.broadcast_event(events.create_event("metrics_updated", {"sequence": i, "cpu": 0.42}))
+        return True
+
+    # Broadcasts are sequential per event, as in the EventBus.
+    return await drive(call, requests, 1)
+
+
+# How long a relayed event may take to reach the WebSocket before it counts as lost
+RELAY_TIMEOUT_SECONDS = 1.0
+
+
+def ensure_api_routes():
+    """Register empty `api.routes` routers when the backend tree does not ship them"""
+    try:
+        import api.routes  # noqa: F401
+        return
+    except ImportError:
+        pass
+    from fastapi import APIRouter
+
+    package = types.ModuleType("api")
+    package.__path__ = []
+    routes = types.ModuleType("api.routes")
+    routes.__path__ = []
+    package.routes = routes
+    sys.modules["api"] = package
+    sys.modules["api.routes"] = routes
+    for name in ("events", "users", "tasks"):
+        module = types.ModuleType(f"api.routes.{name}")
+        module.router = APIRouter()
+        setattr(routes, name, module)
+        sys.modules[module.__name__] = module
+
+
+async def scenario_relay_websocket(requests: int, concurrency: int) -> dict:
+    """Gateway events published to Redis reach a WebSocket client of the backend app
+
+    Runs backend/main.py's own lifespan and /ws endpoint over raw ASGI, so the
+    relay, the broadcast subscription and the subscription filter are the
+    deployed ones. Events that do not arrive within RELAY_TIMEOUT_SECONDS are
+    errors. Events are published one at a time, so concurrency is ignored.
+    """
+    try:
+        import fakeredis
+    except ImportError:
+        raise ScenarioSkipped("fakeredis is not installed")
+
+    os.environ.setdefault("ARCHIVE_ENABLED", "false")
+    events, _, _, _ = backend_modules()
+    ensure_api_routes()
+    server = fakeredis.FakeServer()
+    events.redis.from_url = lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server)
+    try:
+        backend = load_module("backend_main", BACKEND_DIR)
+    except ImportError as e:
+        raise ScenarioSkipped(f"backend app not importable: {e}")
+    publisher = fakeredis.FakeAsyncRedis(server=server)
+
+    incoming: asyncio.Queue = asyncio.Queue()
+    outgoing: asyncio.Queue = asyncio.Queue()
+    scope = {
+        "type": "websocket", "path": "/ws", "raw_path": b"/ws", "root_path": "", "scheme": "ws",
+        "query_string": b"", "headers": [], "subprotocols": [],
+        "client": ("127.0.0.1", 50000), "server": ("backend", 80),
+    }
+
+    async def sent_text() -> str:
+        message = await asyncio.wait_for(outgoing.get(), RELAY_TIMEOUT_SECONDS)
+        return message.get("text") or ""
+
+    async with backend.app.router.lifespan_context(backend.app):
+        await incoming.put({"type": "websocket.connect"})
+        connection = asyncio.create_task(backend.app(scope, incoming.get, outgoing.put))
+        if (await asyncio.wait_for(outgoing.get(), RELAY_TIMEOUT_SECONDS))["type"] != "websocket.accept":
+            raise RuntimeError("backend did not accept the WebSocket")
+        await incoming.put({
+            "type": "websocket.receive",
+            "text": json.dumps({"type": "subscribe", "event_types": ["cost_rollup"]}),
+        })
+        await sent_text()  # subscription_confirmed
+
+        deadline = time.monotonic() + 5
+        while not (await publisher.pubsub_numsub("events:cost_rollup"))[0][1]:
+            if time.monotonic() > deadline:
+                raise RuntimeError("backend never subscribed to events:cost_rollup")
+            await asyncio.sleep(0.01)
+
+        lost = False
+
+        async def call(i: int) -> bool:
+            nonlocal lost
+            if lost:
+                return False  # one lost event means the relay path is broken
+            event_id = f"rollup-{i}"
+            await publisher.publish("events:cost_rollup", json.dumps({
+                "id": event_id,
+                "type": "cost_rollup",
+                "data": {"sequence": i},
+                "timestamp": datetime.utcnow().isoformat(),
+                "user_id": None,
+                "correlation_id": None,
+            }))
+            try:
+                message = json.loads(await sent_text())
+            except asyncio.TimeoutError:
+                lost = True
+                return False
+            return message.get("type") == "event" and message["event"]["id"] == event_id
+
+        result = await drive(call, requests, 1)
+        await incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await connection
+    return result
+
+
+SCENARIOS: Dict[str, Callable[[int, int], Awaitable[dict]]] = {
+    "cache_hit_storm": scenario_cache_hit_storm,
+    "cold_cache": scenario_cold_cache,
+    "overload_limited": scenario_overload_limited,
+    "overload_unlimited": scenario_overload_unlimited,
+    "inference_predict": scenario_inference_predict,
+    "event_burst": scenario_event_burst,
+    "websocket_fanout_5k": scenario_websocket_fanout,
+    "relay_websocket": scenario_relay_websocket,
+}
+
+# (requests, concurrency) defaults per scenario
+DEFAULTS = {
+    "cache_hit_storm": (5000, 100),
+    "cold_cache": (2000, 100),
+    "overload_limited": (2000, 400),
+    "overload_unlimited": (2000, 400),
+    "inference_predict": (5000, 100),
+    "event_burst": (2000, 20),
+    "websocket_fanout_5k": (200, 1),
+    "relay_websocket": (500, 1),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one benchmark scenario and print JSON")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--requests", type=int)
+    parser.add_argument("--concurrency", type=int)
+    args = parser.parse_args(argv)
+
+    random.seed(1234)
+    requests, concurrency = DEFAULTS[args.scenario]
+    try:
+        result = asyncio.run(SCENARIOS[args.scenario](args.requests or requests, args.concurrency or concurrency))
+    except ScenarioSkipped as e:
+        result = {"skipped": str(e)}
+
+    # run.py reads the last stdout line; services may print on import
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Microbenchmarks for the JSON serialization hot paths.
+
+Compares the previous per-consumer `json.dumps` approach with the shared
+serialization layer (`core/serialization.py` in the backend,
+`serialization.py` in the gateway) for each path:
+
+- event fan-out: one publish to Redis plus N WebSocket sends
+- websocket envelope: wrapping an already-encoded event
+- gateway cache key: sorted JSON + sha256
+- gateway cache hit: decode + ChatResponse rebuild vs raw bytes
+
+Usage:
+    python benchmarks/serialization_bench.py [--sockets 100] [--number 2000]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from core.serialization import ENCODER, dumps, loads  # noqa: E402
+
+
+def sample_event() -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "type": "task_updated",
+        "data": {"task_id": 42, "status": "completed", "progress": 1.0, "tags": ["batch", "gpu"] * 4},
+        "timestamp": datetime.utcnow().isoformat(),
+        "user_id": "user-123",
+        "correlation_id": str(uuid.uuid4()),
+    }
+
+
+def sample_request() -> dict:
+    return {
+        "model": "gpt-4",
+        "messages": [
+            {"role": "system", "content": "You are a FinOps assistant. " * 20},
+            {"role": "user", "content": "How can caching reduce API costs?"},
+        ],
+        "max_tokens": 150,
+        "temperature": 0.7,
+    }
+
+
+def sample_response() -> dict:
+    return {
+        "id": "chatcmpl-1700000000",
+        "model": "gpt-4",
+        "usage": {"prompt_tokens": 180, "completion_tokens": 17, "total_tokens": 197},
+        "estimated_cost": 0.00642,
+        "cached": True,
+        "response_text": "Cost optimization strategies include caching, model routing, and rate limiting.",
+    }
+
+
+def bench_paths(sockets: int) -> dict:
+    event = sample_event()
+    request = sample_request()
+    response = sample_response()
+    response_bytes = dumps(response)
+    response_json = json.dumps(response)
+
+    def fanout_baseline():
+        sent = [json.dumps(event)]  # Redis publish
+        for _ in range(sockets):
+            sent.append(json.dumps({"type": "event", "event": event}))
+
+    def fanout_shared():
+        encoded = dumps(event)  # Redis publish reuses these bytes
+        message = '{"type":"event","event":' + encoded.decode() + '}'
+        sent = [encoded]
+        for _ in range(sockets):
+            sent.append(message)
+
+    encoded_event = dumps(event)
+
+    paths = {
+        "event_fanout": (fanout_baseline, fanout_shared),
+        "websocket_envelope": (
+            lambda: json.dumps({"type": "event", "event": event}),
+            lambda: '{"type":"event","event":' + encoded_event.decode() + '}',
+        ),
+        "gateway_cache_key": (
+            lambda: hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest(),
+            lambda: hashlib.sha256(dumps(request, sort_keys=True)).hexdigest(),
+        ),
+        "decode_response": (
+            lambda: json.loads(response_json),
+            lambda: loads(response_bytes),
+        ),
+    }
+
+    try:
+        from pydantic import BaseModel
+        from typing import Dict
+
+        class ChatResponse(BaseModel):
+            id: str
+            model: str
+            usage: Dict[str, int]
+            estimated_cost: float
+            cached: bool
+            response_text: str
+
+        # Previous hit path: json.loads, ChatResponse(**) in the handler, then
+        # FastAPI validates and serializes the response_model again.
+        def cache_hit_baseline():
+            model = ChatResponse(**json.loads(response_json))
+            ChatResponse.model_validate(model.model_dump()).model_dump_json()
+
+        paths["gateway_cache_hit"] = (cache_hit_baseline, lambda: response_bytes)
+    except ImportError:
+        print("pydantic not installed, skipping gateway_cache_hit")
+
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serialization microbenchmarks")
+    parser.add_argument("--sockets", type=int, default=100, help="WebSocket connections per event fan-out")
+    parser.add_argument("--number", type=int, default=2000, help="Iterations per measurement")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"Encoder: {ENCODER}")
+    print(f"{'PATH':<22} {'BASELINE us':>12} {'SHARED us':>12} {'SPEEDUP':>8}")
+    for name, (baseline, shared) in bench_paths(args.sockets).items():
+        base = min(timeit.repeat(baseline, number=args.number, repeat=args.repeat)) / args.number
+        fast = min(timeit.repeat(shared, number=args.number, repeat=args.repeat)) / args.number
+        print(f"{name:<22} {base * 1e6:>12.2f} {fast * 1e6:>12.2f} {base / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Streaming cost-anomaly detection for the AI gateway.
+
+Spend is aggregated per (tenant, model) into short fixed intervals. When an
+interval closes, its total is scored against O(1)-memory rolling statistics
+(EWMA mean/variance, a streaming median/MAD for a robust z-score, and an
+hour-of-day seasonal baseline) so a spike is flagged within one interval
+instead of the days AWS Cost Anomaly Detection needs.
+"""
+import math
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+SEASONAL_SLOTS = 24  # hour-of-day baseline
+MAX_CATCHUP_INTERVALS = 360
+SEASONAL_MIN_SAMPLES = 3
+MIN_RELATIVE_SPREAD = 0.05
+
+
+class RollingStats:
+    """EWMA mean/variance plus a streaming median and MAD estimate"""
+
+    __slots__ = ("alpha", "mean", "var", "median", "mad", "count")
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.var = 0.0
+        self.median = 0.0
+        self.mad = 0.0
+        self.count = 0
+
+    def update(self, x: float):
+        if self.count == 0:
+            self.mean = x
+            self.median = x
+        else:
+            diff = x - self.mean
+            incr = self.alpha * diff
+            self.mean += incr
+            self.var = (1 - self.alpha) * (self.var + diff * incr)
+
+            # Stochastic approximation of the median and the median absolute
+            # deviation; the step scales with the current spread so it adapts
+            # to both cheap and expensive models.
+            step = self.alpha * max(self.mad, abs(self.mean) * 0.05, 1e-9)
+            self.median += step if x > self.median else -step
+            deviation = abs(x - self.median)
+            self.mad += self.alpha * (deviation - self.mad)
+        self.count += 1
+
+
+class SeasonalBaseline:
+    """Hour-of-day EWMA of interval spend"""
+
+    __slots__ = ("alpha", "levels", "counts")
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.levels = [0.0] * SEASONAL_SLOTS
+        self.counts = [0] * SEASONAL_SLOTS
+
+    def expected(self, slot: int) -> Optional[float]:
+        return self.levels[slot] if self.counts[slot] else None
+
+    def update(self, slot: int, x: float):
+        if self.counts[slot] == 0:
+            self.levels[slot] = x
+        else:
+            self.levels[slot] += self.alpha * (x - self.levels[slot])
+        self.counts[slot] += 1
+
+
+class SeriesState:
+    """Per (tenant, model) detector state"""
+
+    __slots__ = ("stats", "seasonal", "bucket_cost", "bucket_tokens", "score")
+
+    def __init__(self, alpha: float, seasonal_alpha: float):
+        self.stats = RollingStats(alpha)
+        self.seasonal = SeasonalBaseline(seasonal_alpha)
+        self.bucket_cost = 0.0
+        self.bucket_tokens = 0
+        self.score = 0.0
+
+
+class CostAnomalyDetector:
+    """Scores per-interval spend and reports anomalies as they close"""
+
+    def __init__(
+        self,
+        interval_seconds: float = 10.0,
+        threshold: float = 6.0,
+        warmup_intervals: int = 12,
+        alpha: float = 0.1,
+        seasonal_alpha: float = 0.2,
+        min_cost: float = 0.0001,
+        on_score: Optional[Callable[[str, str, float], None]] = None,
+    ):
+        self.interval_seconds = interval_seconds
+        self.threshold = threshold
+        self.warmup_intervals = warmup_intervals
+        self.alpha = alpha
+        self.seasonal_alpha = seasonal_alpha
+        self.min_cost = min_cost
+        self.on_score = on_score
+        self.series: Dict[Tuple[str, str], SeriesState] = {}
+        self.bucket_start: Optional[float] = None
+
+    def _bucket_of(self, now: float) -> float:
+        return now - (now % self.interval_seconds)
+
+    def observe(self, tenant: str, model: str, cost: float, tokens: int = 0, now: Optional[float] = None) -> List[dict]:
+        """Record spend; returns any anomalies from intervals closed by this call"""
+        now = time.time() if now is None else now
+        anomalies = self.flush(now)
+
+        key = (tenant, model)
+        state = self.series.get(key)
+        if state is None:
+            state = self.series[key] = SeriesState(self.alpha, self.seasonal_alpha)
+        state.bucket_cost += cost
+        state.bucket_tokens += tokens
+        return anomalies
+
+    def flush(self, now: Optional[float] = None) -> List[dict]:
+        """Close every interval that ended before `now` and score it"""
+        now = time.time() if now is None else now
+        current = self._bucket_of(now)
+        if self.bucket_start is None:
+            self.bucket_start = current
+            return []
+
+        anomalies = []
+        closed = 0
+        while self.bucket_start < current:
+            if closed >= MAX_CATCHUP_INTERVALS:
+                # Long idle gap: the baseline has already seen enough zero
+                # intervals, jump straight to the current one.
+                self.bucket_start = current
+                break
+            anomalies.extend(self._close_bucket(self.bucket_start))
+            self.bucket_start += self.interval_seconds
+            closed += 1
+        return anomalies
+
+    def _close_bucket(self, bucket_start: float) -> List[dict]:
+        slot = datetime.fromtimestamp(bucket_start, tz=timezone.utc).hour
+        anomalies = []
+        for (tenant, model), state in self.series.items():
+            value = state.bucket_cost
+            score = self._score(state, slot, value)
+            state.score = score
+            if self.on_score:
+                self.on_score(tenant, model, score)
+
+            if score >= self.threshold and value >= self.min_cost:
+                anomalies.append({
+                    "tenant": tenant,
+                    "model": model,
+                    "interval_start": datetime.fromtimestamp(bucket_start, tz=timezone.utc).isoformat(),
+                    "interval_seconds": self.interval_seconds,
+                    "cost": round(value, 6),
+                    "tokens": state.bucket_tokens,
+                    "expected_cost": round(state.seasonal.expected(slot) or state.stats.median, 6),
+                    "score": round(score, 2),
+                })
+            else:
+                # Anomalous intervals are kept out of the baseline so a
+                # sustained spike keeps alerting instead of becoming normal.
+                state.stats.update(value)
+                state.seasonal.update(slot, value)
+
+            state.bucket_cost = 0.0
+            state.bucket_tokens = 0
+        return anomalies
+
+    def _score(self, state: SeriesState, slot: int, value: float) -> float:
+        stats = state.stats
+        if stats.count < self.warmup_intervals:
+            return 0.0
+
+        # Use the larger of the two spread estimates so a briefly quiet
+        # EWMA variance does not turn ordinary noise into an alert.
+        spread = max(math.sqrt(stats.var), 1.4826 * stats.mad, abs(stats.median) * MIN_RELATIVE_SPREAD, 1e-9)
+        center = stats.median
+        expected = state.seasonal.expected(slot)
+        if expected is not None and state.seasonal.counts[slot] >= SEASONAL_MIN_SAMPLES:
+            center = expected
+        return max((value - center) / spread, 0.0)
+
+    def scores(self) -> Dict[Tuple[str, str], float]:
+        return {key: state.score for key, state in self.series.items()}
+
+
+def build_alert_event(anomaly: dict) -> dict:
+    """Wrap an anomaly in the backend EventBus message format"""
+    return {
+        "id": str(uuid.uuid4()),
+        "type": "cost_anomaly",
+        "data": anomaly,
+        "timestamp": datetime.utcnow().isoformat(),
+        "user_id": None,
+        "correlation_id": None,
+    }
+
+
+def synthetic_trace(
+    intervals: int = 720,
+    interval_seconds: float = 10.0,
+    base_cost: float = 0.02,
+    noise: float = 0.2,
+    spike_at: int = 600,
+    spike_factor: float = 5.0,
+    spike_length: int = 6,
+    seed: int = 7,
+) -> List[Tuple[float, float]]:
+    """Generate (timestamp, cost) samples with a diurnal wave and one spike"""
+    import random
+
+    rng = random.Random(seed)
+    start = 1_700_000_000.0
+    trace = []
+    for i in range(intervals):
+        ts = start + i * interval_seconds
+        hour = datetime.fromtimestamp(ts, tz=timezone.utc).hour
+        level = base_cost * (1 + 0.3 * math.sin(2 * math.pi * hour / 24))
+        cost = max(0.0, rng.gauss(level, level * noise))
+        if spike_at <= i < spike_at + spike_length:
+            cost *= spike_factor
+        trace.append((ts + interval_seconds / 2, cost))
+    return trace
+
+
+def replay(trace: List[Tuple[float, float]], detector: Optional[CostAnomalyDetector] = None, tenant: str = "replay", model: str = "gpt-4") -> List[dict]:
+    """Feed a recorded (timestamp, cost) trace through a detector"""
+    detector = detector or CostAnomalyDetector()
+    anomalies = []
+    for ts, cost in trace:
+        anomalies.extend(detector.observe(tenant, model, cost, now=ts))
+    if trace:
+        anomalies.extend(detector.flush(trace[-1][0] + detector.interval_seconds))
+    return anomalies
+
+
+if __name__ == "__main__":
+    import sys
+
+    spike_at = 600
+    interval = 10.0
+    trace = synthetic_trace(spike_at=spike_at, interval_seconds=interval)
+    found = replay(trace, CostAnomalyDetector(interval_seconds=interval))
+    spike_start = trace[spike_at][0] - interval / 2
+
+    false_positives = [a for a in found if datetime.fromisoformat(a["interval_start"]).timestamp() < spike_start]
+    hits = [a for a in found if a not in false_positives]
+    for anomaly in found:
+        print(anomaly)
+
+    if not hits:
+        print("FAIL: spike not detected")
+        sys.exit(1)
+    detected_at = datetime.fromisoformat(hits[0]["interval_start"]).timestamp() + interval
+    print(f"Detection latency: {detected_at - spike_start:.0f}s, false positives: {len(false_positives)}")
+    sys.exit(0 if detected_at - spike_start <= 60 and not false_positives else 1)
@@ -0,0 +1,115 @@
+"""Batched Redis cache writes and bulk reads for the AI gateway.
+
+Cache writes from concurrent requests are queued for a short window and sent
+as one non-transactional pipeline, so N misses cost one Redis round trip
+instead of N. Bulk reads use MGET in chunks.
+"""
+import asyncio
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+
+import redis
+from prometheus_client import Counter, Histogram
+
+from instrumentation import span
+
+redis_round_trips = Counter('ai_cache_redis_round_trips_total', 'Redis round trips issued by the cache layer', ['op'])
+round_trips_saved = Counter('ai_cache_round_trips_saved_total', 'Redis round trips avoided by pipelining and MGET', ['op'])
+write_batch_size = Histogram(
+    'ai_cache_write_batch_size', 'Cache writes per Redis pipeline',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+PendingWrite = Tuple[str, int, bytes]
+
+BULK_CHUNK_SIZE = 500
+
+
+class CacheWriteBatcher:
+    """Coalesces SETEX calls into pipelined flushes"""
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        window_ms: float = 5.0,
+        max_batch: int = 256,
+        on_error: Optional[Callable[[List[PendingWrite]], None]] = None,
+    ):
+        self.client = client
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.on_error = on_error
+        self.pending: List[PendingWrite] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        # Batches sent because max_batch was reached, kept so close() can await them
+        self._writes: Set[asyncio.Task] = set()
+
+    def submit(self, key: str, value: bytes, ttl: int):
+        """Queue a write; it is sent with the next flush"""
+        self.pending.append((key, ttl, value))
+        loop = asyncio.get_running_loop()
+        if len(self.pending) >= self.max_batch:
+            batch, self.pending = self.pending, []
+            task = loop.create_task(asyncio.to_thread(self._write, batch))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+        elif self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        await self.flush()
+
+    def _write(self, batch: List[PendingWrite]):
+        try:
+            pipeline_setex(self.client, batch)
+        except redis.RedisError as e:
+            print(f"Cache batch storage error: {e}")
+            if self.on_error:
+                self.on_error(batch)
+
+    async def flush(self):
+        """Write everything queued so far"""
+        batch, self.pending = self.pending, []
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+
+    async def close(self):
+        """Finish the scheduled flush, write what is still queued and wait for in-flight batches (used on shutdown)"""
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+
+def pipeline_setex(client: redis.Redis, batch: Sequence[PendingWrite]):
+    """Send a batch of SETEX commands in a single round trip"""
+    with span("cache_write_pipeline"):
+        pipe = client.pipeline(transaction=False)
+        for key, ttl, value in batch:
+            pipe.setex(key, ttl, value)
+        pipe.execute()
+    redis_round_trips.labels(op="setex").inc()
+    round_trips_saved.labels(op="setex").inc(len(batch) - 1)
+    write_batch_size.observe(len(batch))
+
+
+def mget_chunked(client: redis.Redis, keys: Sequence[str], chunk_size: int = BULK_CHUNK_SIZE) -> List[Optional[bytes]]:
+    """Fetch many keys with one MGET per chunk"""
+    values: List[Optional[bytes]] = []
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        values.extend(client.mget(chunk))
+        redis_round_trips.labels(op="mget").inc()
+        round_trips_saved.labels(op="mget").inc(len(chunk) - 1)
+    return values
+
+
+def setex_pipelined(client: redis.Redis, items: Sequence[PendingWrite], chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """Write many entries with one pipeline per chunk; returns round trips used"""
+    round_trips = 0
+    for start in range(0, len(items), chunk_size):
+        pipeline_setex(client, items[start:start + chunk_size])
+        round_trips += 1
+    return round_trips
@@ -0,0 +1,204 @@
+"""Adaptive concurrency limiting and priority load shedding for the AI gateway.
+
+Each model gets an AIMD limiter on in-flight upstream calls. Each call's
+latency is divided by the processing time the caller expected for it (a
+400-token completion is slower than a 5-token one without any overload), and
+the limit grows by one per limit's worth of completions while that ratio
+stays within `tolerance` times its no-load baseline. It is cut by `backoff`
+(at most once per recent call latency) when it does not. Requests over the limit wait in a
+bounded priority queue ordered by tenant tier and then deadline; a request
+is shed with `LoadShed` when the queue is full of higher-priority work, when
+the waiters ahead of it make its deadline unreachable, or when a slot does
+not free up while the deadline can still be met.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+concurrency_limit = Gauge('ai_concurrency_limit', 'Adaptive concurrency limit per model', ['model'])
+queue_depth = Gauge('ai_concurrency_queue_depth', 'Requests waiting for a concurrency slot', ['model'])
+queue_time = Histogram(
+    'ai_concurrency_queue_seconds', 'Time admitted requests waited for a concurrency slot', ['model'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+shed_requests = Counter('ai_requests_shed_total', 'Requests rejected by load shedding', ['model', 'tier', 'reason'])
+
+# Lower value is served first
+TIER_PRIORITY = {"premium": 0, "standard": 1, "free": 2}
+DEFAULT_TIER = "standard"
+
+# Fraction of the gap to a higher latency the no-load baseline closes per
+# second; slow enough that sustained overload cannot redefine "no load"
+BASELINE_DRIFT_PER_SECOND = 0.01
+
+
+def parse_tenant_tiers(spec: str) -> Dict[str, str]:
+    """Parse "tenant:tier,tenant:tier" (as in the TENANT_TIERS env var)"""
+    tiers = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        tenant, _, tier = item.partition(":")
+        if tier not in TIER_PRIORITY:
+            raise ValueError(f"Unknown tier {tier!r} for tenant {tenant!r}; expected one of {sorted(TIER_PRIORITY)}")
+        tiers[tenant] = tier
+    return tiers
+
+
+class LoadShed(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a bounded priority wait queue"""
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = 20,
+        min_limit: float = 1,
+        max_limit: float = 200,
+        queue_size: int = 100,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_size = queue_size
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        # Recent latency over recent expected processing time, and its no-load baseline
+        self.baseline: Optional[float] = None
+        self.recent_latency = 0.0
+        self.recent_expected = 0.0
+        self.last_decrease = 0.0
+        self.last_sample = time.monotonic()
+        # [priority, deadline, sequence, tier, future]; sequence keeps FIFO order within ties
+        self.waiters: List[list] = []
+        self._sequence = itertools.count()
+        concurrency_limit.labels(model=name).set(self.limit)
+
+    async def acquire(self, tier: str, deadline: float) -> float:
+        """Wait for a slot; returns seconds queued or raises LoadShed"""
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            queue_time.labels(model=self.name).observe(0)
+            return 0.0
+
+        entry = [TIER_PRIORITY[tier], deadline, next(self._sequence), tier, asyncio.get_running_loop().create_future()]
+        start = time.monotonic()
+
+        # Shed now rather than after queueing when the waiters ahead already
+        # push the expected completion past the deadline
+        ahead = sum(1 for waiter in self.waiters if waiter < entry)
+        if start + (ahead / self.limit + 1) * self.service_time() > deadline:
+            self._shed(tier, "deadline")
+
+        if len(self.waiters) >= self.queue_size:
+            worst = max(self.waiters)
+            if worst < entry:
+                self._shed(tier, "queue_full")
+            # Displace the lowest-priority, latest-deadline waiter
+            self.waiters.remove(worst)
+            heapq.heapify(self.waiters)
+            self._reject(worst, "displaced")
+        heapq.heappush(self.waiters, entry)
+        queue_depth.labels(model=self.name).set(len(self.waiters))
+
+        future = entry[-1]
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - start - self.service_time()))
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._discard(entry)
+                self._shed(tier, "deadline")
+        except asyncio.CancelledError:
+            # Client went away; give back a slot granted in the meantime
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(None)
+            self._discard(entry)
+            raise
+        future.result()  # raises LoadShed if this waiter was displaced
+
+        waited = time.monotonic() - start
+        queue_time.labels(model=self.name).observe(waited)
+        return waited
+
+    def service_time(self) -> float:
+        """Expected upstream latency; admitting later than deadline minus this is wasted work"""
+        return self.recent_latency
+
+    def release(self, latency: Optional[float], expected: Optional[float] = None):
+        """Return a slot
+
+        `latency` of the upstream call, relative to the `expected` no-load
+        processing time of that call when given, drives the limit (None skips
+        the update).
+        """
+        self.in_flight -= 1
+        if latency is not None:
+            self._update_limit(latency, expected or 1.0)
+        self._admit_waiters()
+
+    def _update_limit(self, latency: float, expected: float):
+        now = time.monotonic()
+        if self.baseline is None:
+            self.recent_latency, self.recent_expected = latency, expected
+        self.recent_latency += (latency - self.recent_latency) * 0.2
+        self.recent_expected += (expected - self.recent_expected) * 0.2
+        # Ratio of averages: a few ms of jitter on a short call barely moves it
+        slowdown = self.recent_latency / self.recent_expected
+
+        if self.baseline is None or slowdown < self.baseline:
+            self.baseline = slowdown
+        else:
+            # Decaying minimum: follows a real change in upstream speed, but slowly
+            drift = min(1.0, (now - self.last_sample) * BASELINE_DRIFT_PER_SECOND)
+            self.baseline += (slowdown - self.baseline) * drift
+        self.last_sample = now
+
+        if slowdown > self.baseline * self.tolerance:
+            if now - self.last_decrease >= self.recent_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+        elif self.in_flight + 1 >= self.limit / 2:
+            # Only grow while the limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        concurrency_limit.labels(model=self.name).set(self.limit)
+
+    def _admit_waiters(self):
+        cutoff = time.monotonic() + self.service_time()
+        while self.waiters and self.in_flight < self.limit:
+            entry = heapq.heappop(self.waiters)
+            future = entry[-1]
+            if future.done():
+                continue
+            if entry[1] <= cutoff:
+                self._reject(entry, "deadline")
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+        queue_depth.labels(model=self.name).set(len(self.waiters))
+
+    def _discard(self, entry: list):
+        entry[-1].cancel()
+        if entry in self.waiters:
+            self.waiters.remove(entry)
+            heapq.heapify(self.waiters)
+            queue_depth.labels(model=self.name).set(len(self.waiters))
+
+    def _reject(self, entry: list, reason: str):
+        if not entry[-1].done():
+            shed_requests.labels(model=self.name, tier=entry[3], reason=reason).inc()
+            entry[-1].set_exception(LoadShed(reason))
+
+    def _shed(self, tier: str, reason: str):
+        shed_requests.labels(model=self.name, tier=tier, reason=reason).inc()
+        raise LoadShed(reason)
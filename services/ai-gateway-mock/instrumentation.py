@@ -0,0 +1,169 @@
+"""Hot-path span timers and an on-demand sampling profiler.
+
+`span("name")` times a block into the `hotpath_span_seconds` Prometheus
+histogram and, when OTEL_EXPORTER_OTLP_ENDPOINT is set and the OpenTelemetry
+SDK is installed, also emits an OTLP span. Both backends are optional; with
+neither available a span costs two perf_counter calls.
+
+`sample_stacks(seconds)` samples every thread's Python stack and returns
+them in the collapsed "frame;frame;frame count" format consumed by
+flamegraph.pl and speedscope.
+
+This module is kept identical in the gateway, backend and batch worker;
+each service is its own Docker build context.
+"""
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "app")
+
+MAX_PROFILE_SECONDS = 60.0
+MIN_PROFILE_INTERVAL = 0.001
+
+try:
+    from prometheus_client import Histogram
+
+    span_duration = Histogram(
+        'hotpath_span_seconds', 'Time spent in instrumented hot-path spans', ['service', 'span'],
+        buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    )
+except ImportError:
+    span_duration = None
+
+_tracer = None
+_observers: Dict[str, Callable[[float], None]] = {}
+
+
+def init(service_name: str):
+    """Name this service's spans and start OTLP export if configured"""
+    global SERVICE_NAME, _tracer
+    SERVICE_NAME = os.getenv("SERVICE_NAME", service_name)
+    _observers.clear()
+
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") or _tracer is not None:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        print(f"OTLP export requested but OpenTelemetry is not installed: {e}")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer(__name__)
+
+
+def _observer(name: str) -> Optional[Callable[[float], None]]:
+    observe = _observers.get(name)
+    if observe is None and span_duration is not None:
+        observe = _observers[name] = span_duration.labels(service=SERVICE_NAME, span=name).observe
+    return observe
+
+
+class span:
+    """Context manager timing a hot-path block"""
+
+    __slots__ = ("name", "start", "otel")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.otel = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self.otel = _tracer.start_as_current_span(self.name)
+            self.otel.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        observe = _observer(self.name)
+        if observe is not None:
+            observe(elapsed)
+        if self.otel is not None:
+            self.otel.__exit__(exc_type, exc, tb)
+        return False
+
+
+def timed(name: str):
+    """Decorator form of `span` for sync and async functions"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Counter:
+    """Sample all thread stacks for `seconds`; only one profile runs at a time"""
+    # `not >=` also rejects NaN
+    if not interval >= MIN_PROFILE_INTERVAL:
+        raise ValueError(f"interval must be at least {MIN_PROFILE_INTERVAL * 1000:g} ms")
+    if not seconds > 0:
+        raise ValueError("seconds must be positive")
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+    try:
+        seconds = min(max(seconds, interval), MAX_PROFILE_SECONDS)
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_label(frame))
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(frames))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _profile_lock.release()
+
+
+def collapse(stacks: Counter) -> str:
+    """Render samples in collapsed-stack format, hottest first"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+async def profile(seconds: float, interval: float = 0.005) -> str:
+    """Run the sampler off the event loop so the loop itself gets sampled"""
+    return collapse(await asyncio.to_thread(sample_stacks, seconds, interval))
@@ -1,30 +1,104 @@
 import asyncio
 import hashlib
-import json
+import math
+import os
+import re
 import time
-from typing import Dict, Optional
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
 
+import httpx
 import redis
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 
-app = FastAPI(title="AI Gateway Mock", version="1.0.0")
+import instrumentation
+from instrumentation import span
+from anomaly import CostAnomalyDetector, build_alert_event
+from cache_batcher import BULK_CHUNK_SIZE, CacheWriteBatcher, mget_chunked, setex_pipelined
+from concurrency import DEFAULT_TIER, AdaptiveLimiter, LoadShed, parse_tenant_tiers
+from prefix_cache import PrefixCache, prefix_digests
+from rollups import RESOLUTIONS, RollupStore, build_rollup_event, decode_field
+from serialization import dumps, loads
 
-# Redis for caching (optional, falls back to in-memory)
-try:
-    redis_client = redis.Redis(host='redis', port=6379, decode_responses=True)
-    redis_client.ping()
-    CACHE_ENABLED = True
-except (redis.ConnectionError, redis.TimeoutError) as e:
-    redis_client = None
-    CACHE_ENABLED = False
-    print(f"Redis not available, using in-memory cache: {e}")
+def process_start_time() -> float:
+    """Wall-clock time the process started, from /proc when available"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+PROCESS_START = process_start_time()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here blocks: Redis, prewarm and readiness all settle in the background
+    tasks = [
+        asyncio.create_task(anomaly_flush_loop()),
+        asyncio.create_task(redis_watch_loop()),
+        asyncio.create_task(warm_up()),
+        asyncio.create_task(rollup_loop()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    if anomaly_dispatches:
+        await asyncio.gather(*anomaly_dispatches, return_exceptions=True)
+    if cache_writer:
+        await cache_writer.close()
+    if rollups_restored:
+        await persist_rollups()
+
+app = FastAPI(title="AI Gateway Mock", version="1.0.0", lifespan=lifespan)
+instrumentation.init("ai-gateway")
+
+# /debug/profile is unauthenticated; enable it only where the port is not exposed
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
 
-# In-memory cache fallback
-memory_cache = {}
+# Redis for caching (optional, falls back to in-memory). The connection is
+# made lazily in the background and upgraded to whenever Redis appears, so a
+# Redis that is slow to start never blocks or permanently disables the cache.
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+REDIS_RETRY_MAX_SECONDS = float(os.getenv("REDIS_RETRY_MAX_SECONDS", "10"))
+REDIS_HEALTH_INTERVAL = 10.0
+redis_client: Optional[redis.Redis] = None
+CACHE_ENABLED = False
+redis_first_attempt = asyncio.Event()
+
+# Startup and readiness
+STARTUP_REDIS_WAIT_SECONDS = float(os.getenv("STARTUP_REDIS_WAIT_SECONDS", "2"))
+CACHE_PREWARM_FILE = os.getenv("CACHE_PREWARM_FILE")
+CACHE_PREWARM_MODEL = os.getenv("CACHE_PREWARM_MODEL", "gpt-4")
+startup_state = {
+    "ready": False,
+    "prewarm": "pending" if CACHE_PREWARM_FILE else "disabled",
+    "ready_seconds": None,
+    "first_request_seconds": None
+}
+
+# In-memory cache fallback (encoded response bodies)
+memory_cache: Dict[str, bytes] = {}
+
+CACHE_TTL_SECONDS = 3600
+CACHE_WRITE_WINDOW_MS = float(os.getenv("CACHE_WRITE_WINDOW_MS", "5"))
+
+def store_in_memory(batch: list):
+    """Keep writes that failed to reach Redis in the local cache"""
+    for key, _, value in batch:
+        memory_cache[key] = value
+
+# Cache writes from concurrent requests share one Redis pipeline per window;
+# created once Redis is connected
+cache_writer: Optional[CacheWriteBatcher] = None
 
 # Prometheus metrics
 token_counter = Counter('ai_tokens_total', 'Total tokens processed', ['type', 'model'])
@@ -33,35 +107,116 @@ request_duration = Histogram('ai_request_duration_seconds', 'Request duration',
 cache_hits = Counter('ai_cache_hits_total', 'Cache hits')
 cache_misses = Counter('ai_cache_misses_total', 'Cache misses')
 active_requests = Gauge('ai_active_requests', 'Currently active requests')
+ready_seconds = Gauge('ai_gateway_ready_seconds', 'Seconds from process start until the gateway reported ready')
+first_request_seconds = Gauge('ai_gateway_first_request_seconds', 'Seconds from process start until the first completion was served')
+anomaly_score = Gauge('ai_cost_anomaly_score', 'Latest spend anomaly score per interval', ['tenant', 'model'])
+anomaly_alerts = Counter('ai_cost_anomalies_total', 'Spend anomalies detected', ['tenant', 'model'])
+prefix_hits = Counter('ai_prefix_cache_hits_total', 'Cache misses that reused a cached prompt prefix', ['model'])
+prefix_savings = Counter('ai_prefix_cache_savings_total', 'USD saved by billing cached prompt prefixes at the cached-input rate', ['model'])
+
+# Streaming spend anomaly detection
+ANOMALY_INTERVAL_SECONDS = float(os.getenv("ANOMALY_INTERVAL_SECONDS", "10"))
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "6.0"))
+ANOMALY_WEBHOOK_URL = os.getenv("ANOMALY_WEBHOOK_URL")
+ANOMALY_EVENT_CHANNEL = "events:cost_anomaly"  # backend EventBus channel naming
+
+anomaly_detector = CostAnomalyDetector(
+    interval_seconds=ANOMALY_INTERVAL_SECONDS,
+    threshold=ANOMALY_THRESHOLD,
+    on_score=lambda tenant, model, score: anomaly_score.labels(tenant=tenant, model=model).set(score)
+)
+# Alert dispatches started from requests; held so they are not garbage
+# collected mid-flight and awaited on shutdown
+anomaly_dispatches: Set[asyncio.Task] = set()
+
+# Prompt-prefix caching: reused prefixes are billed at cached_input_cost_per_1k
+# and skip PREFIX_LATENCY_SAVING of the prefill (latency_base) share
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE_ENABLED", "true").lower() == "true"
+PREFIX_LATENCY_SAVING = float(os.getenv("PREFIX_LATENCY_SAVING", "0.8"))
+
+prefix_cache = PrefixCache(
+    max_entries=int(os.getenv("PREFIX_CACHE_MAX_ENTRIES", "100000")),
+    max_tokens=int(os.getenv("PREFIX_CACHE_MAX_TOKENS", "50000000")),
+    ttl_seconds=float(os.getenv("PREFIX_CACHE_TTL_SECONDS", "300")),
+    min_tokens=int(os.getenv("PREFIX_CACHE_MIN_TOKENS", "32"))
+)
+
+# Cost rollups per tenant and model: published as deltas for dashboards every
+# ROLLUP_PUBLISH_SECONDS and snapshotted to Redis every ROLLUP_PERSIST_SECONDS
+ROLLUP_PUBLISH_SECONDS = float(os.getenv("ROLLUP_PUBLISH_SECONDS", "10"))
+ROLLUP_PERSIST_SECONDS = float(os.getenv("ROLLUP_PERSIST_SECONDS", "60"))
+ROLLUP_EVENT_CHANNEL = "events:cost_rollup"
+# One snapshot per gateway instance, restored only by an instance of the same
+# name. Pods of a Deployment get new hostnames, so without a stable
+# ROLLUP_INSTANCE history does not survive a rollout; the TTL, refreshed on
+# every persist, removes the snapshots replaced pods leave behind.
+ROLLUP_REDIS_KEY = f"rollups:{os.getenv('ROLLUP_INSTANCE', os.getenv('HOSTNAME', 'ai-gateway'))}"
+ROLLUP_SNAPSHOT_TTL_SECONDS = int(os.getenv("ROLLUP_SNAPSHOT_TTL_SECONDS", str(7 * 86400)))
+
+rollups = RollupStore()
+rollups_restored = False
 
 # Model configurations
 MODEL_CONFIGS = {
     "gpt-4": {
         "input_cost_per_1k": 0.03,
+        "cached_input_cost_per_1k": 0.015,
         "output_cost_per_1k": 0.06,
         "latency_base": 2.0,
-        "tokens_per_second": 50
+        "tokens_per_second": 50,
+        "upstream_concurrency": 32
     },
     "gpt-3.5-turbo": {
         "input_cost_per_1k": 0.001,
+        "cached_input_cost_per_1k": 0.0005,
         "output_cost_per_1k": 0.002,
         "latency_base": 0.5,
-        "tokens_per_second": 100
+        "tokens_per_second": 100,
+        "upstream_concurrency": 64
     },
     "claude-haiku": {
         "input_cost_per_1k": 0.00025,
+        "cached_input_cost_per_1k": 0.000025,
         "output_cost_per_1k": 0.00125,
         "latency_base": 0.3,
-        "tokens_per_second": 120
+        "tokens_per_second": 120,
+        "upstream_concurrency": 64
     }
 }
 
+# Adaptive concurrency limiting: calls beyond a model's limit queue by tenant
+# tier and deadline, and are shed with 503 when they cannot be served in time.
+# The simulated upstream slows down proportionally past upstream_concurrency.
+CONCURRENCY_LIMIT_ENABLED = os.getenv("CONCURRENCY_LIMIT_ENABLED", "true").lower() == "true"
+DEFAULT_DEADLINE_MS = int(os.getenv("DEFAULT_DEADLINE_MS", "30000"))
+TENANT_TIERS = parse_tenant_tiers(os.getenv("TENANT_TIERS", ""))
+
+# `tenant` is a free-form request field. Tenants named in TENANT_TIERS plus the
+# first MAX_TRACKED_TENANTS others seen get their own metric labels and
+# per-tenant state; any further tenants are counted together as OTHER_TENANT.
+MAX_TRACKED_TENANTS = int(os.getenv("MAX_TRACKED_TENANTS", "100"))
+OTHER_TENANT = "other"
+tracked_tenants: set = set()
+
+limiters = {
+    model: AdaptiveLimiter(
+        model,
+        initial_limit=int(os.getenv("CONCURRENCY_INITIAL_LIMIT", "20")),
+        max_limit=int(os.getenv("CONCURRENCY_MAX_LIMIT", "200")),
+        queue_size=int(os.getenv("CONCURRENCY_QUEUE_SIZE", "100"))
+    )
+    for model in MODEL_CONFIGS
+}
+upstream_in_flight: Dict[str, int] = {model: 0 for model in MODEL_CONFIGS}
+
 class ChatRequest(BaseModel):
     model: str = "gpt-4"
     messages: list
     max_tokens: Optional[int] = 150
     temperature: Optional[float] = 0.7
     enable_cache: Optional[bool] = True
+    tenant: Optional[str] = "default"
+    deadline_ms: Optional[int] = None
 
 class ChatResponse(BaseModel):
     id: str
@@ -77,34 +232,42 @@ def estimate_tokens(text: str) -> int:
 
 def generate_cache_key(request: ChatRequest) -> str:
     """Generate cache key from request"""
-    content = json.dumps({
+    content = dumps({
         "model": request.model,
         "messages": request.messages,
         "max_tokens": request.max_tokens,
         "temperature": request.temperature
     }, sort_keys=True)
-    return hashlib.sha256(content.encode()).hexdigest()
+    return hashlib.sha256(content).hexdigest()
 
-def get_from_cache(key: str) -> Optional[dict]:
-    """Get response from cache"""
+def get_from_cache(key: str) -> Optional[bytes]:
+    """Get an encoded response body from cache"""
     if CACHE_ENABLED and redis_client:
         try:
-            cached = redis_client.get(key)
-            return json.loads(cached) if cached else None
-        except (redis.RedisError, json.JSONDecodeError) as e:
+            return redis_client.get(key)
+        except redis.RedisError as e:
             print(f"Cache retrieval error: {e}")
     return memory_cache.get(key)
 
-def set_cache(key: str, value: dict, ttl: int = 3600):
-    """Set response in cache"""
-    if CACHE_ENABLED and redis_client:
-        try:
-            redis_client.setex(key, ttl, json.dumps(value))
-            return
-        except (redis.RedisError, json.JSONEncodeError) as e:
-            print(f"Cache storage error: {e}")
+# Cached bodies are stored encoded; the hit path reads only their cost
+CACHED_COST = re.compile(rb'"estimated_cost":\s*([-+0-9.eE]+)')
+
+def cached_cost(body: bytes) -> float:
+    """estimated_cost of a cached response without decoding the whole body"""
+    match = CACHED_COST.search(body)
+    return float(match.group(1)) if match else loads(body)["estimated_cost"]
+
+def set_cache(key: str, value: bytes, ttl: int = CACHE_TTL_SECONDS):
+    """Queue an encoded response body for the next batched cache write"""
+    if CACHE_ENABLED and cache_writer:
+        cache_writer.submit(key, value, ttl)
+        return
     memory_cache[key] = value
 
+def json_response(body: bytes) -> Response:
+    """Return pre-encoded JSON without re-validating it through ChatResponse"""
+    return Response(content=body, media_type="application/json")
+
 def simulate_ai_response(request: ChatRequest) -> str:
     """Generate a mock AI response"""
     responses = [
@@ -116,6 +279,239 @@ def simulate_ai_response(request: ChatRequest) -> str:
     ]
     return responses[hash(str(request.messages)) % len(responses)]
 
+def tenant_label(tenant: Optional[str]) -> str:
+    """Bounded tenant name for metric labels and per-tenant aggregates"""
+    tenant = tenant or "default"
+    if tenant in tracked_tenants or tenant in TENANT_TIERS:
+        return tenant
+    if len(tracked_tenants) < MAX_TRACKED_TENANTS:
+        tracked_tenants.add(tenant)
+        return tenant
+    return OTHER_TENANT
+
+def match_prompt_prefix(request: ChatRequest) -> int:
+    """Input tokens covered by a cached prompt prefix; records this prompt's prefixes"""
+    digests = prefix_digests(request.tenant or "default", request.model, request.messages)
+
+    # Cumulative estimates matching estimate_tokens() of the space-joined
+    # prompt used for billing
+    cumulative_tokens = []
+    chars = -1
+    for msg in request.messages:
+        chars += len(msg.get("content", "")) + 1
+        cumulative_tokens.append(max(1, chars // 4))
+
+    cached_tokens = prefix_cache.lookup(digests)
+    prefix_cache.insert(digests, cumulative_tokens)
+    return cached_tokens
+
+def build_response_data(request: ChatRequest, config: dict, cached_tokens: int = 0) -> dict:
+    """Simulate the upstream completion and price it"""
+    with span("token_estimation"):
+        input_text = " ".join([msg.get("content", "") for msg in request.messages])
+        input_tokens = estimate_tokens(input_text)
+        cached_tokens = min(cached_tokens, input_tokens)
+
+        response_text = simulate_ai_response(request)
+        output_tokens = min(estimate_tokens(response_text), request.max_tokens)
+
+    input_cost = ((input_tokens - cached_tokens) / 1000) * config["input_cost_per_1k"]
+    input_cost += (cached_tokens / 1000) * config["cached_input_cost_per_1k"]
+    output_cost = (output_tokens / 1000) * config["output_cost_per_1k"]
+    total_cost = input_cost + output_cost
+
+    return {
+        "id": f"chatcmpl-{int(time.time())}",
+        "model": request.model,
+        "usage": {
+            "prompt_tokens": input_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        },
+        "estimated_cost": round(total_cost, 6),
+        "cached": False,
+        "response_text": response_text
+    }
+
+async def dispatch_anomalies(anomalies: list):
+    """Send anomaly alerts to the event bus and the optional webhook"""
+    for anomaly in anomalies:
+        anomaly_alerts.labels(tenant=anomaly["tenant"], model=anomaly["model"]).inc()
+        print(f"Cost anomaly detected: {anomaly}")
+        event = build_alert_event(anomaly)
+
+        if CACHE_ENABLED and redis_client:
+            try:
+                await asyncio.to_thread(redis_client.publish, ANOMALY_EVENT_CHANNEL, dumps(event))
+            except redis.RedisError as e:
+                print(f"Anomaly publish error: {e}")
+
+        if ANOMALY_WEBHOOK_URL:
+            try:
+                async with httpx.AsyncClient(timeout=5.0) as client:
+                    await client.post(ANOMALY_WEBHOOK_URL, content=dumps(event), headers={"Content-Type": "application/json"})
+            except httpx.HTTPError as e:
+                print(f"Anomaly webhook error: {e}")
+
+async def anomaly_flush_loop():
+    """Close anomaly intervals even when no traffic arrives"""
+    while True:
+        await asyncio.sleep(ANOMALY_INTERVAL_SECONDS)
+        anomalies = anomaly_detector.flush()
+        if anomalies:
+            await dispatch_anomalies(anomalies)
+
+async def try_connect_redis() -> bool:
+    """Connect to Redis and switch the cache over to it"""
+    global redis_client, cache_writer, CACHE_ENABLED
+    client = redis.Redis(
+        host=REDIS_HOST, port=REDIS_PORT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT, socket_timeout=REDIS_CONNECT_TIMEOUT * 4
+    )
+    try:
+        await asyncio.to_thread(client.ping)
+    except redis.RedisError as e:
+        print(f"Redis not available, using in-memory cache: {e}")
+        return False
+
+    # Carry entries cached locally while Redis was away (including a boot
+    # prewarm) over to Redis so other replicas see them too.
+    if memory_cache:
+        local = [(key, CACHE_TTL_SECONDS, value) for key, value in memory_cache.items()]
+        try:
+            await asyncio.to_thread(setex_pipelined, client, local)
+            memory_cache.clear()
+        except redis.RedisError as e:
+            print(f"Cache migration to Redis failed: {e}")
+
+    redis_client = client
+    cache_writer = CacheWriteBatcher(client, window_ms=CACHE_WRITE_WINDOW_MS, on_error=store_in_memory)
+    CACHE_ENABLED = True
+    print(f"Connected to Redis at {REDIS_HOST}:{REDIS_PORT}, cache upgraded")
+    return True
+
+async def redis_watch_loop():
+    """Retry Redis with backoff until it appears, then watch for it going away"""
+    global CACHE_ENABLED
+    delay = REDIS_CONNECT_TIMEOUT
+    while True:
+        if not CACHE_ENABLED:
+            connected = await try_connect_redis()
+            redis_first_attempt.set()
+            delay = REDIS_HEALTH_INTERVAL if connected else min(delay * 2, REDIS_RETRY_MAX_SECONDS)
+        else:
+            try:
+                await asyncio.to_thread(redis_client.ping)
+            except redis.RedisError as e:
+                CACHE_ENABLED = False
+                delay = REDIS_CONNECT_TIMEOUT
+                print(f"Redis connection lost, using in-memory cache: {e}")
+        await asyncio.sleep(delay)
+
+async def warm_up():
+    """Give Redis a brief chance to connect, prewarm the cache, then report ready"""
+    try:
+        await asyncio.wait_for(redis_first_attempt.wait(), STARTUP_REDIS_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+
+    if CACHE_PREWARM_FILE:
+        try:
+            with open(CACHE_PREWARM_FILE) as f:
+                requests = [parse_prewarm_line(line, CACHE_PREWARM_MODEL) for line in f if line.strip()]
+            result = await prewarm(requests)
+            startup_state["prewarm"] = "complete"
+            print(f"Cache prewarmed from {CACHE_PREWARM_FILE}: {result}")
+        except (OSError, ValueError, redis.RedisError) as e:
+            # A failed prewarm leaves a cold but working cache; don't block readiness
+            startup_state["prewarm"] = "failed"
+            print(f"Cache prewarm failed: {e}")
+
+    elapsed = time.time() - PROCESS_START
+    startup_state["ready"] = True
+    startup_state["ready_seconds"] = round(elapsed, 3)
+    ready_seconds.set(elapsed)
+
+def write_rollup_snapshot(fields: Dict[bytes, bytes]):
+    pipe = redis_client.pipeline(transaction=False)
+    if fields:
+        pipe.hset(ROLLUP_REDIS_KEY, mapping=fields)
+    pipe.expire(ROLLUP_REDIS_KEY, ROLLUP_SNAPSHOT_TTL_SECONDS)
+    pipe.execute()
+
+async def persist_rollups():
+    """Write changed rollup series to Redis and refresh the snapshot's TTL"""
+    fields = rollups.snapshot()
+    try:
+        await asyncio.to_thread(write_rollup_snapshot, fields)
+    except redis.RedisError as e:
+        rollups.dirty.update(decode_field(field)[:2] for field in fields)
+        print(f"Rollup persist error: {e}")
+
+async def rollup_loop():
+    """Publish rollup deltas; restore, then periodically persist, rollups in Redis"""
+    global rollups_restored
+    last_persist = time.monotonic()
+    while True:
+        await asyncio.sleep(ROLLUP_PUBLISH_SECONDS)
+        if not (CACHE_ENABLED and redis_client):
+            continue
+        
+        # History from before a restart is merged in before anything is written over it
+        if not rollups_restored:
+            try:
+                snapshot = await asyncio.to_thread(redis_client.hgetall, ROLLUP_REDIS_KEY)
+                print(f"Restored {rollups.restore(snapshot)} rollup series from Redis")
+                rollups_restored = True
+                # Restored tenants count towards the tracked-tenant cap
+                for tenant, _ in list(rollups.series):
+                    tenant_label(tenant)
+            except redis.RedisError as e:
+                print(f"Rollup restore error: {e}")
+                continue
+        
+        since, deltas = rollups.drain_deltas()
+        if deltas:
+            try:
+                event = build_rollup_event(since, time.time(), deltas)
+                await asyncio.to_thread(redis_client.publish, ROLLUP_EVENT_CHANNEL, dumps(event))
+            except redis.RedisError as e:
+                print(f"Rollup publish error: {e}")
+        
+        if time.monotonic() - last_persist >= ROLLUP_PERSIST_SECONDS:
+            await persist_rollups()
+            last_persist = time.monotonic()
+
+def record_first_request():
+    elapsed = time.time() - PROCESS_START
+    startup_state["first_request_seconds"] = round(elapsed, 3)
+    first_request_seconds.set(elapsed)
+
+async def call_upstream(request: ChatRequest, config: dict) -> Tuple[dict, float]:
+    """Simulate the upstream completion, including prompt-prefix cache savings
+
+    Returns the response and the call's processing time without load, which
+    the concurrency limiter compares the observed latency against.
+    """
+    cached_tokens = 0
+    if PREFIX_CACHE_ENABLED:
+        with span("prefix_lookup"):
+            cached_tokens = match_prompt_prefix(request)
+    
+    response_data = build_response_data(request, config, cached_tokens)
+    usage = response_data["usage"]
+    cached_tokens = usage["cached_prompt_tokens"]
+    
+    # Simulate processing time based on model; a cached prefix skips most of its prefill
+    prefill = config["latency_base"] * (1 - PREFIX_LATENCY_SAVING * cached_tokens / usage["prompt_tokens"])
+    no_load_time = prefill + (request.max_tokens / config["tokens_per_second"])
+    # The upstream shares its capacity between everything in flight
+    processing_time = no_load_time * max(1.0, upstream_in_flight[request.model] / config["upstream_concurrency"])
+    with span("upstream_simulation"):
+        await asyncio.sleep(min(processing_time, 5.0))  # Cap at 5 seconds for demo
+    return response_data, min(no_load_time, 5.0)
+
 @app.post("/v1/chat/completions", response_model=ChatResponse)
 async def chat_completions(request: ChatRequest):
     active_requests.inc()
@@ -131,75 +527,230 @@ async def chat_completions(request: ChatRequest):
         # Check cache if enabled
         cached_response = None
         if request.enable_cache:
-            cache_key = generate_cache_key(request)
-            cached_response = get_from_cache(cache_key)
+            with span("cache_lookup"):
+                cache_key = generate_cache_key(request)
+                cached_response = get_from_cache(cache_key)
             
             if cached_response:
                 cache_hits.inc()
-                return ChatResponse(**cached_response)
+                rollups.record(
+                    tenant_label(request.tenant), request.model,
+                    requests=1, cache_hits=1, cache_savings=cached_cost(cached_response)
+                )
+                if startup_state["first_request_seconds"] is None:
+                    record_first_request()
+                return json_response(cached_response)
         
         cache_misses.inc()
         
-        # Calculate input tokens
-        input_text = " ".join([msg.get("content", "") for msg in request.messages])
-        input_tokens = estimate_tokens(input_text)
-        
-        # Simulate processing time based on model
-        processing_time = config["latency_base"] + (request.max_tokens / config["tokens_per_second"])
-        await asyncio.sleep(min(processing_time, 5.0))  # Cap at 5 seconds for demo
+        # Admission control for the upstream call
+        limiter = limiters[request.model] if CONCURRENCY_LIMIT_ENABLED else None
+        if limiter:
+            tier = TENANT_TIERS.get(request.tenant or "default", DEFAULT_TIER)
+            deadline = time.monotonic() + (request.deadline_ms or DEFAULT_DEADLINE_MS) / 1000
+            try:
+                await limiter.acquire(tier, deadline)
+            except LoadShed as e:
+                raise HTTPException(
+                    status_code=503, detail=f"Overloaded, request shed ({e.reason})", headers={"Retry-After": "1"}
+                )
         
-        # Generate response
-        response_text = simulate_ai_response(request)
-        output_tokens = min(estimate_tokens(response_text), request.max_tokens)
+        upstream_start = time.monotonic()
+        upstream_in_flight[request.model] += 1
+        expected_time = None
+        try:
+            response_data, expected_time = await call_upstream(request, config)
+        finally:
+            upstream_in_flight[request.model] -= 1
+            if limiter:
+                # Failed calls give back their slot without a latency sample
+                latency = time.monotonic() - upstream_start if expected_time is not None else None
+                limiter.release(latency, expected_time)
         
-        # Calculate costs
-        input_cost = (input_tokens / 1000) * config["input_cost_per_1k"]
-        output_cost = (output_tokens / 1000) * config["output_cost_per_1k"]
-        total_cost = input_cost + output_cost
+        usage = response_data["usage"]
+        total_cost = response_data["estimated_cost"]
+        cached_tokens = usage["cached_prompt_tokens"]
         
         # Update metrics
-        token_counter.labels(type="input", model=request.model).inc(input_tokens)
-        token_counter.labels(type="output", model=request.model).inc(output_tokens)
+        token_counter.labels(type="input", model=request.model).inc(usage["prompt_tokens"] - cached_tokens)
+        token_counter.labels(type="output", model=request.model).inc(usage["completion_tokens"])
+        prefix_saved = cached_tokens / 1000 * (config["input_cost_per_1k"] - config["cached_input_cost_per_1k"])
+        if cached_tokens:
+            token_counter.labels(type="input_cached", model=request.model).inc(cached_tokens)
+            prefix_hits.labels(model=request.model).inc()
+            prefix_savings.labels(model=request.model).inc(prefix_saved)
         cost_counter.labels(model=request.model).inc(total_cost)
+        rollups.record(
+            tenant_label(request.tenant), request.model,
+            requests=1,
+            input_tokens=usage["prompt_tokens"] - cached_tokens,
+            cached_input_tokens=cached_tokens,
+            output_tokens=usage["completion_tokens"],
+            cost=total_cost,
+            cache_savings=prefix_saved
+        )
+        anomalies = anomaly_detector.observe(tenant_label(request.tenant), request.model, total_cost, usage["total_tokens"])
+        if anomalies:
+            dispatch = asyncio.create_task(dispatch_anomalies(anomalies))
+            anomaly_dispatches.add(dispatch)
+            dispatch.add_done_callback(anomaly_dispatches.discard)
         
-        response_data = {
-            "id": f"chatcmpl-{int(time.time())}",
-            "model": request.model,
-            "usage": {
-                "prompt_tokens": input_tokens,
-                "completion_tokens": output_tokens,
-                "total_tokens": input_tokens + output_tokens
-            },
-            "estimated_cost": round(total_cost, 6),
-            "cached": False,
-            "response_text": response_text
-        }
-        
-        # Cache the response
-        if request.enable_cache:
-            set_cache(cache_key, response_data)
+        # Cache the response; hits are served as stored, already marked cached
+        with span("response_encoding"):
+            if request.enable_cache:
+                set_cache(cache_key, dumps({**response_data, "cached": True}))
+            body = dumps(response_data)
         
-        return ChatResponse(**response_data)
+        if startup_state["first_request_seconds"] is None:
+            record_first_request()
+        return json_response(body)
         
     finally:
         active_requests.dec()
         request_duration.labels(model=request.model).observe(time.time() - start_time)
 
+def parse_prewarm_line(line: str, model: str) -> ChatRequest:
+    """A prewarm line is a ChatRequest JSON object or a bare prompt"""
+    line = line.strip()
+    try:
+        payload = loads(line)
+    except ValueError:
+        payload = line
+    if isinstance(payload, dict):
+        request = ChatRequest(**{"model": model, **payload})
+        if request.max_tokens is None:
+            raise ValueError("max_tokens must be an integer")
+        return request
+    return ChatRequest(model=model, messages=[{"role": "user", "content": str(payload)}])
+
+@app.post("/admin/cache/prewarm")
+async def prewarm_cache(request: Request, model: str = "gpt-4"):
+    """Bulk-load the response cache from a newline-delimited file of prompts
+
+    Each line is either a ChatRequest JSON object or a plain prompt. Existing
+    entries are found with chunked MGET and missing ones written with
+    pipelined SETEX, so the whole file costs a handful of round trips.
+    """
+    body = await request.body()
+    try:
+        requests = [parse_prewarm_line(line, model) for line in body.decode().splitlines() if line.strip()]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid prewarm entry: {e}")
+
+    unsupported = {r.model for r in requests} - MODEL_CONFIGS.keys()
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Models not supported: {sorted(unsupported)}")
+
+    try:
+        return await prewarm(requests)
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Cache prewarm failed: {e}")
+
+async def prewarm(requests: List[ChatRequest]) -> dict:
+    """Fill the cache for every request not already cached"""
+    entries = {generate_cache_key(r): r for r in requests if r.model in MODEL_CONFIGS}
+    keys = list(entries)
+
+    round_trips = 0
+    if CACHE_ENABLED and redis_client:
+        existing = await asyncio.to_thread(mget_chunked, redis_client, keys)
+        round_trips += math.ceil(len(keys) / BULK_CHUNK_SIZE)
+    else:
+        existing = [memory_cache.get(key) for key in keys]
+    missing = [key for key, value in zip(keys, existing) if value is None]
+
+    writes = []
+    total_cost = 0.0
+    for key in missing:
+        response_data = build_response_data(entries[key], MODEL_CONFIGS[entries[key].model])
+        total_cost += response_data["estimated_cost"]
+        writes.append((key, CACHE_TTL_SECONDS, dumps({**response_data, "cached": True})))
+
+    if CACHE_ENABLED and redis_client:
+        round_trips += await asyncio.to_thread(setex_pipelined, redis_client, writes)
+    else:
+        store_in_memory(writes)
+
+    return {
+        "requests": len(requests),
+        "unique": len(keys),
+        "already_cached": len(keys) - len(missing),
+        "written": len(writes),
+        "estimated_cost": round(total_cost, 6),
+        "redis_round_trips": round_trips
+    }
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    """Sample all thread stacks and return them in collapsed (flamegraph) format"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    try:
+        return await instrumentation.profile(seconds, interval_ms / 1000)
+    except instrumentation.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "cache_enabled": CACHE_ENABLED}
 
+@app.get("/ready")
+async def readiness_check():
+    """Ready once startup warm-up (Redis attempt and optional prewarm) has finished"""
+    body = {**startup_state, "cache_enabled": CACHE_ENABLED}
+    return JSONResponse(status_code=200 if startup_state["ready"] else 503, content=body)
+
 @app.get("/metrics")
 async def metrics():
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/stats")
-async def get_stats():
-    """Get current statistics"""
+async def get_stats(
+    window: float = 3600,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    resolution: Optional[str] = None,
+    group_by: str = "model",
+    tenant: Optional[str] = None,
+    model: Optional[str] = None,
+    series: bool = False
+):
+    """Get current statistics and cost rollups for a time range
+    
+    The range is [start, end] in epoch seconds, or the last `window` seconds.
+    """
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Resolution must be one of {list(RESOLUTIONS)}")
+    if group_by not in ("model", "tenant", "none"):
+        raise HTTPException(status_code=400, detail="group_by must be model, tenant or none")
+    now = time.time()
+    end = now if end is None else end
+    start = end - window if start is None else start
+    if not (math.isfinite(start) and math.isfinite(end)):
+        raise HTTPException(status_code=400, detail="start and end must be finite")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    
     return {
+        "rollups": rollups.query(
+            start, end, resolution=resolution, tenant=tenant, model=model,
+            group_by=group_by, series=series, now=now
+        ),
         "cache_enabled": CACHE_ENABLED,
         "supported_models": list(MODEL_CONFIGS.keys()),
-        "cache_size": len(memory_cache) if not CACHE_ENABLED else "redis"
+        "cache_size": len(memory_cache) if not CACHE_ENABLED else "redis",
+        "concurrency": {
+            model: {"limit": round(limiter.limit, 1), "in_flight": limiter.in_flight, "queued": len(limiter.waiters)}
+            for model, limiter in limiters.items()
+        },
+        "prefix_cache": {
+            "enabled": PREFIX_CACHE_ENABLED,
+            "entries": len(prefix_cache),
+            "tokens": prefix_cache.tokens_held,
+            "evictions": prefix_cache.evictions
+        }
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+"""Prompt-prefix cache for the AI gateway.
+
+Providers bill a reused prompt prefix (a long system prompt, or the earlier
+turns of a conversation) at a discounted cached-input rate and skip most of
+its prefill time. The exact-match response cache only helps when the whole
+message list repeats; this index finds the longest previously seen prefix
+of a request so the gateway can simulate that discount.
+
+Prefixes are identified by a chained hash: the digest of messages[:i] is
+sha256(digest of messages[:i-1] + message i), seeded with tenant and model,
+so a lookup costs one hash per message and one dict probe per prefix. Entries
+are kept in LRU order and evicted past an entry count or a total-token budget
+(the stand-in for the provider's KV-cache memory), and expire after a TTL.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+from serialization import dumps
+
+
+def prefix_digests(tenant: str, model: str, messages: Sequence[dict]) -> List[bytes]:
+    """Chained digests of every message-list prefix, shortest first"""
+    digest = hashlib.sha256(f"{tenant}\x00{model}".encode()).digest()
+    digests = []
+    for message in messages:
+        digest = hashlib.sha256(digest + dumps(message, sort_keys=True)).digest()
+        digests.append(digest)
+    return digests
+
+
+class PrefixCache:
+    """LRU index of prompt prefixes and their cumulative token counts"""
+
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        max_tokens: int = 50_000_000,
+        ttl_seconds: float = 300.0,
+        min_tokens: int = 32,
+    ):
+        self.max_entries = max_entries
+        self.max_tokens = max_tokens
+        self.ttl = ttl_seconds
+        self.min_tokens = min_tokens
+        # digest -> (cumulative tokens, expiry)
+        self.entries: "OrderedDict[bytes, Tuple[int, float]]" = OrderedDict()
+        self.tokens_held = 0
+        self.evictions = 0
+
+    def lookup(self, digests: Sequence[bytes], now: Optional[float] = None) -> int:
+        """Token count of the longest cached prefix, 0 when none is cached"""
+        now = time.time() if now is None else now
+        for digest in reversed(digests):
+            entry = self.entries.get(digest)
+            if entry is None:
+                continue
+            tokens, expires = entry
+            if expires <= now:
+                self._remove(digest)
+                continue
+            self.entries.move_to_end(digest)
+            return tokens
+        return 0
+
+    def insert(self, digests: Sequence[bytes], cumulative_tokens: Sequence[int], now: Optional[float] = None):
+        """Record every prefix long enough to be cached, refreshing its TTL"""
+        now = time.time() if now is None else now
+        expires = now + self.ttl
+        for digest, tokens in zip(digests, cumulative_tokens):
+            if tokens < self.min_tokens:
+                continue
+            if digest in self.entries:
+                self.entries.move_to_end(digest)
+            else:
+                self.tokens_held += tokens
+            self.entries[digest] = (tokens, expires)
+        self._evict()
+
+    def _remove(self, digest: bytes):
+        tokens, _ = self.entries.pop(digest)
+        self.tokens_held -= tokens
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.tokens_held > self.max_tokens):
+            _, (tokens, _) = self.entries.popitem(last=False)
+            self.tokens_held -= tokens
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,329 @@
+"""Incremental, time-bucketed cost rollups for the AI gateway.
+
+Every request adds its counts to a minute, an hour and a day bucket of its
+(tenant, model) series. Each resolution is a fixed-size ring of buckets in
+flat `array('d')` storage, so recording is O(1), memory is bounded, and a
+range query reads one bucket per interval instead of scanning raw events.
+Rings are allocated in pages as buckets are first written, so a series that
+only saw a few minutes of traffic holds a few pages rather than a full day.
+
+Series are snapshotted to a Redis hash so a restarted gateway keeps its
+history, and the deltas recorded since the last publish can be sent as
+`cost_rollup` events for live dashboards.
+"""
+import time
+import uuid
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+FIELDS = (
+    "requests",
+    "cache_hits",
+    "input_tokens",
+    "cached_input_tokens",
+    "output_tokens",
+    "cost",
+    "cache_savings",
+)
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+NUM_FIELDS = len(FIELDS)
+
+# name -> (bucket width in seconds, buckets kept), finest first
+RESOLUTIONS = {
+    "minute": (60, 24 * 60),
+    "hour": (3600, 31 * 24),
+    "day": (86400, 400),
+}
+
+# Ring slots allocated together on first write
+PAGE_SLOTS = 60
+# Prefix of snapshots holding only allocated pages; older snapshots hold
+# every slot and are still read
+PAGED_SNAPSHOT = b"RPG1"
+
+SeriesKey = Tuple[str, str]
+
+
+class RingSeries:
+    """Fixed number of buckets of one resolution; old buckets are overwritten"""
+
+    __slots__ = ("width", "slots", "pages")
+
+    def __init__(self, width: int, slots: int):
+        self.width = width
+        self.slots = slots
+        # Page number -> (bucket number held by each slot, -1 when empty,
+        # and its field values), allocated on first write
+        self.pages: Dict[int, Tuple[array, array]] = {}
+
+    def _page(self, page: int) -> Tuple[array, array]:
+        held = self.pages.get(page)
+        if held is None:
+            size = min(PAGE_SLOTS, self.slots - page * PAGE_SLOTS)
+            held = self.pages[page] = (array("q", [-1]) * size, array("d", bytes(8 * size * NUM_FIELDS)))
+        return held
+
+    def add(self, bucket: int, deltas: Sequence[float]):
+        page, slot = divmod(bucket % self.slots, PAGE_SLOTS)
+        buckets, values = self._page(page)
+        base = slot * NUM_FIELDS
+        held = buckets[slot]
+        if held != bucket:
+            if held > bucket:
+                return  # older than the retained window
+            buckets[slot] = bucket
+            for i in range(base, base + NUM_FIELDS):
+                values[i] = 0.0
+        for i, delta in enumerate(deltas):
+            if delta:
+                values[base + i] += delta
+
+    def get(self, bucket: int) -> Optional[Sequence[float]]:
+        page, slot = divmod(bucket % self.slots, PAGE_SLOTS)
+        held = self.pages.get(page)
+        if held is None or held[0][slot] != bucket:
+            return None
+        base = slot * NUM_FIELDS
+        return held[1][base:base + NUM_FIELDS]
+
+    def items(self) -> Iterator[Tuple[int, Sequence[float]]]:
+        """(bucket, values) for every bucket held"""
+        for buckets, values in self.pages.values():
+            for slot, bucket in enumerate(buckets):
+                if bucket >= 0:
+                    base = slot * NUM_FIELDS
+                    yield bucket, values[base:base + NUM_FIELDS]
+
+    def between(self, first: int, last: int) -> Iterator[Tuple[int, Sequence[float]]]:
+        """(bucket, values) for buckets held in [first, last], probing the range
+        or scanning the allocated pages, whichever is fewer slots"""
+        if last - first < len(self.pages) * PAGE_SLOTS:
+            for bucket in range(first, last + 1):
+                values = self.get(bucket)
+                if values is not None:
+                    yield bucket, values
+        else:
+            for bucket, values in self.items():
+                if first <= bucket <= last:
+                    yield bucket, values
+
+    def merge(self, other: "RingSeries"):
+        for bucket, values in other.items():
+            self.add(bucket, values)
+
+    def to_bytes(self) -> bytes:
+        """Allocated pages only: each is its page number, bucket numbers and values"""
+        parts = [PAGED_SNAPSHOT]
+        for page in sorted(self.pages):
+            buckets, values = self.pages[page]
+            parts += [array("q", [page]).tobytes(), buckets.tobytes(), values.tobytes()]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, width: int, slots: int, blob: bytes) -> "RingSeries":
+        series = cls(width, slots)
+        full = 8 * slots * (1 + NUM_FIELDS)
+        if len(blob) == full:
+            series._load_pages(0, slots, blob)  # every slot, as written before paging
+            return series
+        if not blob.startswith(PAGED_SNAPSHOT):
+            raise ValueError("snapshot does not match the configured resolution")
+        offset = len(PAGED_SNAPSHOT)
+        pages = -(-slots // PAGE_SLOTS)
+        while offset < len(blob):
+            page = array("q", blob[offset:offset + 8])[0] if len(blob) >= offset + 8 else -1
+            if not 0 <= page < pages:
+                raise ValueError("snapshot does not match the configured resolution")
+            size = min(PAGE_SLOTS, slots - page * PAGE_SLOTS)
+            end = offset + 8 + 8 * size * (1 + NUM_FIELDS)
+            if end > len(blob):
+                raise ValueError("truncated rollup snapshot")
+            series._load_pages(page * PAGE_SLOTS, size, blob[offset + 8:end])
+            offset = end
+        return series
+
+    def _load_pages(self, first: int, size: int, blob: bytes):
+        """Add `size` slots starting at slot `first` (bucket numbers, then values)"""
+        buckets, values = array("q"), array("d")
+        buckets.frombytes(blob[:8 * size])
+        values.frombytes(blob[8 * size:])
+        for slot, bucket in enumerate(buckets):
+            if bucket >= 0 and bucket % self.slots == first + slot:
+                base = slot * NUM_FIELDS
+                self.add(bucket, values[base:base + NUM_FIELDS])
+
+
+def _new_resolutions() -> Dict[str, RingSeries]:
+    return {name: RingSeries(width, slots) for name, (width, slots) in RESOLUTIONS.items()}
+
+
+def encode_field(tenant: str, model: str, resolution: str) -> bytes:
+    """Redis hash field of one series resolution; parts are percent-encoded"""
+    return "\t".join(quote(part, safe="") for part in (tenant, model, resolution)).encode()
+
+
+def decode_field(field: bytes) -> Tuple[str, str, str]:
+    """Inverse of encode_field; raises ValueError for malformed fields"""
+    parts = field.decode().split("\t")
+    if len(parts) != 3:
+        raise ValueError(f"expected 3 tab-separated parts, got {len(parts)}")
+    tenant, model, resolution = (unquote(part) for part in parts)
+    return tenant, model, resolution
+
+
+class RollupStore:
+    """Minute/hour/day rollups per (tenant, model)"""
+
+    def __init__(self):
+        self.series: Dict[SeriesKey, Dict[str, RingSeries]] = {}
+        self.dirty: set = set()
+        self.pending: Dict[SeriesKey, array] = {}
+        self.pending_since = time.time()
+
+    def record(self, tenant: str, model: str, now: Optional[float] = None, **values: float):
+        """Add one request's counts (keyword arguments named after FIELDS)"""
+        now = time.time() if now is None else now
+        deltas = [0.0] * NUM_FIELDS
+        for name, value in values.items():
+            deltas[FIELD_INDEX[name]] = value
+
+        key = (tenant, model)
+        resolutions = self.series.get(key)
+        if resolutions is None:
+            resolutions = self.series[key] = _new_resolutions()
+        for series in resolutions.values():
+            series.add(int(now // series.width), deltas)
+        self.dirty.add(key)
+
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = array("d", bytes(8 * NUM_FIELDS))
+        for i, delta in enumerate(deltas):
+            pending[i] += delta
+
+    @staticmethod
+    def pick_resolution(start: float, now: float) -> str:
+        """Finest resolution that still retains `start`"""
+        for name, (width, slots) in RESOLUTIONS.items():
+            if now - start < width * (slots - 1):
+                return name
+        return list(RESOLUTIONS)[-1]
+
+    def query(
+        self,
+        start: float,
+        end: float,
+        resolution: Optional[str] = None,
+        tenant: Optional[str] = None,
+        model: Optional[str] = None,
+        group_by: str = "model",
+        series: bool = False,
+        now: Optional[float] = None,
+    ) -> dict:
+        """Totals for [start, end], grouped by model, tenant or nothing
+
+        Reads one bucket per resolution interval in the range for each matching
+        series; buckets partially inside the range are counted whole. The range
+        is clipped to the retained window, so a far-future `end` stops at now.
+        """
+        now = time.time() if now is None else now
+        resolution = resolution or self.pick_resolution(start, now)
+        width, slots = RESOLUTIONS[resolution]
+        current = int(now // width)
+        first = max(int(start // width), current - slots + 1)
+        last = min(int(end // width), current)
+
+        totals = [0.0] * NUM_FIELDS
+        groups: Dict[str, List[float]] = {}
+        points: Dict[int, List[float]] = {}
+        for (series_tenant, series_model), resolutions in self.series.items():
+            if (tenant and series_tenant != tenant) or (model and series_model != model):
+                continue
+            ring = resolutions[resolution]
+            group = None
+            if group_by in ("model", "tenant"):
+                group = groups.setdefault(series_model if group_by == "model" else series_tenant, [0.0] * NUM_FIELDS)
+            for bucket, values in ring.between(first, last):
+                for i, value in enumerate(values):
+                    totals[i] += value
+                    if group is not None:
+                        group[i] += value
+                if series:
+                    point = points.setdefault(bucket, [0.0] * NUM_FIELDS)
+                    for i, value in enumerate(values):
+                        point[i] += value
+
+        result = {
+            "start": first * width,
+            "end": (last + 1) * width,
+            "resolution": resolution,
+            "totals": _named(totals),
+            "groups": {name: _named(values) for name, values in sorted(groups.items())},
+        }
+        if series:
+            result["series"] = [{"bucket_start": bucket * width, **_named(points[bucket])} for bucket in sorted(points)]
+        return result
+
+    def drain_deltas(self) -> Tuple[float, List[dict]]:
+        """Counts recorded since the previous drain, per (tenant, model)"""
+        since, self.pending_since = self.pending_since, time.time()
+        pending, self.pending = self.pending, {}
+        return since, [
+            {"tenant": tenant, "model": model, **_named(values)}
+            for (tenant, model), values in pending.items()
+        ]
+
+    def snapshot(self) -> Dict[bytes, bytes]:
+        """Changed series as Redis hash fields, clearing the dirty set"""
+        dirty, self.dirty = self.dirty, set()
+        return {
+            encode_field(tenant, model, name): ring.to_bytes()
+            for tenant, model in dirty
+            for name, ring in self.series[(tenant, model)].items()
+        }
+
+    def restore(self, fields: Dict[bytes, bytes]) -> int:
+        """Merge a snapshot read back from Redis; returns series restored"""
+        restored = set()
+        for field, blob in fields.items():
+            try:
+                tenant, model, name = decode_field(field)
+            except ValueError as e:
+                print(f"Skipping rollup snapshot field {field!r}: {e}")
+                continue
+            if name not in RESOLUTIONS:
+                continue
+            try:
+                ring = RingSeries.from_bytes(*RESOLUTIONS[name], blob)
+            except ValueError as e:
+                print(f"Skipping rollup snapshot {tenant}/{model}/{name}: {e}")
+                continue
+            resolutions = self.series.setdefault((tenant, model), _new_resolutions())
+            resolutions[name].merge(ring)
+            restored.add((tenant, model))
+        return len(restored)
+
+
+def _named(values: Iterable[float]) -> Dict[str, float]:
+    named = {}
+    for name, value in zip(FIELDS, values):
+        named[name] = round(value, 6) if name in ("cost", "cache_savings") else int(value)
+    return named
+
+
+def build_rollup_event(since: float, until: float, deltas: List[dict]) -> dict:
+    """Wrap rollup deltas in the backend EventBus message format"""
+    return {
+        "id": str(uuid.uuid4()),
+        "type": "cost_rollup",
+        "data": {
+            "interval_start": datetime.utcfromtimestamp(since).isoformat(),
+            "interval_end": datetime.utcfromtimestamp(until).isoformat(),
+            "rollups": deltas,
+        },
+        "timestamp": datetime.utcnow().isoformat(),
+        "user_id": None,
+        "correlation_id": None,
+    }
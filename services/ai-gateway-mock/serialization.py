@@ -0,0 +1,65 @@
+"""JSON serialization with an optional fast encoder.
+
+Uses orjson when installed, then msgspec, and falls back to the stdlib json
+module. Every encoder produces compact UTF-8 bytes with the same structure,
+key order and string escaping, but float formatting differs: orjson writes
+6.1e-05 as 0.000061 and 1e16 as 1e16 where stdlib json writes 6.1e-05 and
+1e+16. Payloads decode to the same values either way, but hashes of encoded
+bytes (such as the gateway's cache keys) only match between processes using
+the same encoder, so replicas sharing a cache should all install orjson.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _default(obj: Any):
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    ENCODER = "orjson"
+
+    def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+
+    loads = orjson.loads
+
+elif msgspec is not None:
+    ENCODER = "msgspec"
+    _encoder = msgspec.json.Encoder(enc_hook=_default)
+    _decoder = msgspec.json.Decoder()
+
+    def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+        if sort_keys:
+            return _encoder.encode(msgspec.to_builtins(obj, enc_hook=_default, order="sorted"))
+        return _encoder.encode(obj)
+
+    loads = _decoder.decode
+
+else:
+    ENCODER = "json"
+
+    def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+        return json.dumps(
+            obj, default=_default, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False
+        ).encode()
+
+    loads = json.loads
+
+
+def dumps_str(obj: Any) -> str:
+    """Encode to a str, for APIs such as WebSocket.send_text"""
+    return dumps(obj).decode()
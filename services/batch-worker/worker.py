@@ -1,24 +1,65 @@
 import os
+import signal
+import threading
 import time
+import json
 import logging
 from datetime import datetime
 
+import instrumentation
+from instrumentation import span
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def start_profile(signum=None, frame=None):
+    """SIGUSR1 handler: sample stacks in the background and write them to PROFILE_DIR"""
+    path = os.path.join(os.getenv('PROFILE_DIR', '/tmp'), f"worker-profile-{int(time.time())}.folded")
+
+    # Everything that can fail runs in the profiler thread: an exception in a
+    # signal handler would surface in the batch the main thread is processing
+    def run():
+        try:
+            stacks = instrumentation.sample_stacks(float(os.getenv('PROFILE_SECONDS', '10')))
+        except (instrumentation.ProfilerBusy, ValueError) as e:
+            logger.warning(f"Profile skipped: {e}")
+            return
+        with open(path, 'w') as f:
+            f.write(instrumentation.collapse(stacks))
+        logger.info(f"Profile written to {path}")
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+
 class BatchWorker:
     def __init__(self):
         self.worker_id = os.getenv('WORKER_ID', 'worker-1')
         self.batch_size = int(os.getenv('BATCH_SIZE', '32'))
         self.max_iterations = int(os.getenv('MAX_ITERATIONS', '100'))
-        
+        self.batch_ids = self.load_batch_order(os.getenv('BATCH_ORDER_FILE'))
+
+    def load_batch_order(self, path):
+        """Batch ids in processing order: this worker's queue from BATCH_ORDER_FILE, else 0..MAX_ITERATIONS-1"""
+        if not path:
+            return list(range(self.max_iterations))
+        with open(path) as f:
+            queues = json.load(f)
+        if isinstance(queues, dict):
+            if self.worker_id not in queues:
+                raise ValueError(f"{path} has no queue for {self.worker_id}")
+            queues = queues[self.worker_id]
+        logger.info(f"Worker {self.worker_id} processing {len(queues)} batches in order from {path}")
+        return [int(batch_id) for batch_id in queues]
+
+    @instrumentation.timed("process_batch")
     def process_batch(self, batch_id: int):
         """Simulate AI model training batch processing"""
         logger.info(f"Worker {self.worker_id} processing batch {batch_id}")
         
         # Simulate training work
         processing_time = 2 + (batch_id % 3)  # Variable processing time
-        time.sleep(processing_time)
+        with span("training_step"):
+            time.sleep(processing_time)
         
         metrics = {
             'batch_id': batch_id,
@@ -36,20 +77,26 @@ class BatchWorker:
         """Main worker loop"""
         logger.info(f"Starting batch worker {self.worker_id}")
         
-        for iteration in range(self.max_iterations):
+        for iteration, batch_id in enumerate(self.batch_ids):
             try:
-                metrics = self.process_batch(iteration)
+                metrics = self.process_batch(batch_id)
                 
                 # Simulate saving metrics to monitoring system
                 if iteration % 10 == 0:
-                    logger.info(f"Progress: {iteration}/{self.max_iterations} batches completed")
+                    logger.info(f"Progress: {iteration}/{len(self.batch_ids)} batches completed")
                     
             except Exception as e:
-                logger.error(f"Error processing batch {iteration}: {e}")
+                logger.error(f"Error processing batch {batch_id}: {e}")
                 continue
         
-        logger.info(f"Worker {self.worker_id} completed all {self.max_iterations} batches")
+        logger.info(f"Worker {self.worker_id} completed all {len(self.batch_ids)} batches")
 
 if __name__ == "__main__":
+    instrumentation.init("batch-worker")
+    if os.getenv('METRICS_PORT'):
+        from prometheus_client import start_http_server
+        start_http_server(int(os.getenv('METRICS_PORT')))
+    signal.signal(signal.SIGUSR1, start_profile)
+
     worker = BatchWorker()
     worker.run()
\ No newline at end of file
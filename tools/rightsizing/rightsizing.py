@@ -0,0 +1,520 @@
+"""Rightsizing recommender for container requests/limits.
+
+Ingests container CPU and memory usage history, either as Prometheus range
+query dumps (`/api/v1/query_range` JSON, one file per query window) or as a
+CSV export, and builds per-container usage profiles in fixed-size log-scale
+histograms. Input is streamed: CSV in chunks of rows and range-query dumps
+one series at a time, so week-long, multi-million sample histories are
+profiled in a few MB of memory beyond the largest single series.
+
+From the profiles it recommends requests/limits, compares them to the
+requests declared in Kubernetes manifests, projects monthly savings and
+emits strategic-merge patches ready for `kubectl patch`.
+
+Examples:
+    # rate(container_cpu_usage_seconds_total[5m]) and
+    # container_memory_working_set_bytes dumps
+    python rightsizing.py --cpu cpu-*.json --memory mem-*.json \\
+        --manifests ../../platform/ai-gateway/ai-gateway.yaml
+
+    # CSV with columns timestamp,namespace,pod,container,resource,value
+    python rightsizing.py --csv usage.csv --output report.json
+"""
+import argparse
+import csv
+import json
+import math
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import yaml
+except ImportError:  # manifests are optional
+    yaml = None
+
+# Histogram layout per resource: (smallest value, largest value). Values are
+# CPU cores and memory bytes. 2% bucket growth keeps percentile error <2%.
+HISTOGRAM_RANGES = {
+    "cpu": (1e-4, 512.0),
+    "memory": (2.0 ** 20, 2.0 ** 42),
+}
+BUCKET_GROWTH = 1.02
+
+# Recommendation policy: (request percentile, request headroom, limit headroom)
+POLICY = {
+    "cpu": (95.0, 0.15, 0.20),
+    "memory": (99.0, 0.15, 0.25),
+}
+MIN_CPU_CORES = 0.01
+MIN_MEMORY_BYTES = 16 * 2 ** 20
+
+# Rightsizing KPI targets from docs/cost-kpis.md
+UTILIZATION_TARGETS = {"cpu": 0.75, "memory": 0.70}
+
+# On-demand Fargate list price (us-east-1) used for projected savings
+DEFAULT_CPU_PRICE_PER_HOUR = 0.04048
+DEFAULT_GIB_PRICE_PER_HOUR = 0.004445
+HOURS_PER_MONTH = 730
+
+# Deployment pods are named <deployment>-<replicaset hash>-<pod hash>,
+# DaemonSet pods <daemonset>-<pod hash> and StatefulSet pods <statefulset>-<ordinal>.
+# Generated hashes only use Kubernetes' vowel-free alphabet, so a workload
+# name ending in an ordinary word is not taken for a hash.
+SAFE_CHARS = "[bcdfghjklmnpqrstvwxz2456789]"
+POD_SUFFIX = re.compile(rf"-{SAFE_CHARS}{{5,10}}-{SAFE_CHARS}{{5}}$|-{SAFE_CHARS}{{5}}$|-[0-9]+$")
+REPLICASET_SUFFIX = re.compile(rf"-{SAFE_CHARS}{{5,10}}$")
+
+CHUNK_ROWS = 100_000
+DUMP_READ_CHARS = 1 << 20
+
+# Range-query response framing ahead of the series array
+RESULT_ARRAY = re.compile(r'"result"\s*:\s*\[')
+# Range-query response fields and their expected values; with sorted keys
+# ("data" before "status") they follow the series array instead
+RESPONSE_FIELDS = {
+    re.compile(r'"status"\s*:\s*"([^"]*)"'): "success",
+    re.compile(r'"resultType"\s*:\s*"([^"]*)"'): "matrix",
+}
+
+WorkloadKey = Tuple[str, str, str]  # (namespace, workload, container)
+
+
+def workload_name(pod: str, labels: Optional[Dict[str, str]] = None) -> str:
+    """Owning workload of a pod, from owner labels when the series has them
+
+    `workload` comes from kube-prometheus' pod owner recording rules and
+    `created_by_name` from kube_pod_info joins; otherwise the name is derived
+    from the pod name.
+    """
+    labels = labels or {}
+    if labels.get("workload"):
+        return labels["workload"]
+    if labels.get("created_by_name"):
+        owner = labels["created_by_name"]
+        return REPLICASET_SUFFIX.sub("", owner) if labels.get("created_by_kind") == "ReplicaSet" else owner
+    return POD_SUFFIX.sub("", pod)
+
+
+class LogHistogram:
+    """Fixed-size log-bucketed histogram with exact peak and mean"""
+
+    def __init__(self, resource: str):
+        low, high = HISTOGRAM_RANGES[resource]
+        self.low = low
+        self.log_growth = math.log(BUCKET_GROWTH)
+        self.bins = int(math.ceil(math.log(high / low) / self.log_growth)) + 2
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.peak = 0.0
+        self.total = 0.0
+        self.samples = 0
+
+    def bucket_indices(self, values: np.ndarray) -> np.ndarray:
+        # Bucket 0 holds everything below `low` (idle containers report 0).
+        scaled = np.log(np.maximum(values, self.low) / self.low) / self.log_growth
+        return np.clip(np.floor(scaled).astype(np.int64) + 1, 0, self.bins - 1) * (values >= self.low)
+
+    def add_counts(self, counts: np.ndarray, peak: float, total: float, samples: int):
+        self.counts += counts
+        self.peak = max(self.peak, float(peak))
+        self.total += float(total)
+        self.samples += samples
+
+    def add(self, values: np.ndarray):
+        if values.size:
+            self.add_counts(
+                np.bincount(self.bucket_indices(values), minlength=self.bins),
+                float(values.max()), float(values.sum()), int(values.size)
+            )
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        rank = q / 100.0 * self.samples
+        index = int(np.searchsorted(np.cumsum(self.counts), rank, side="left"))
+        if index == 0:
+            return 0.0
+        # Upper edge of the bucket, capped at the observed peak
+        return min(self.low * BUCKET_GROWTH ** index, self.peak)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.samples if self.samples else 0.0
+
+
+@dataclass
+class ContainerProfile:
+    cpu: LogHistogram = field(default_factory=lambda: LogHistogram("cpu"))
+    memory: LogHistogram = field(default_factory=lambda: LogHistogram("memory"))
+
+
+class UsageAggregator:
+    """Accumulates usage samples into per-container profiles"""
+
+    def __init__(self):
+        self.profiles: Dict[WorkloadKey, ContainerProfile] = {}
+
+    def profile(self, key: WorkloadKey) -> ContainerProfile:
+        if key not in self.profiles:
+            self.profiles[key] = ContainerProfile()
+        return self.profiles[key]
+
+    def add_series(self, key: WorkloadKey, resource: str, values: np.ndarray):
+        getattr(self.profile(key), resource).add(values)
+
+    def add_chunk(self, keys: List[WorkloadKey], key_ids: np.ndarray, resource: str, values: np.ndarray):
+        """Add a chunk of samples for many containers with one bincount"""
+        valid = np.isfinite(values)
+        key_ids, values = key_ids[valid], values[valid]
+        if not values.size:
+            return
+
+        reference = LogHistogram(resource)
+        bins = reference.bins
+        flat = np.bincount(key_ids * bins + reference.bucket_indices(values), minlength=len(keys) * bins)
+        per_key = flat.reshape(len(keys), bins)
+        samples = np.bincount(key_ids, minlength=len(keys))
+        totals = np.bincount(key_ids, weights=values, minlength=len(keys))
+        peaks = np.zeros(len(keys))
+        np.maximum.at(peaks, key_ids, values)
+
+        for i, key in enumerate(keys):
+            if samples[i]:
+                getattr(self.profile(key), resource).add_counts(per_key[i], peaks[i], totals[i], int(samples[i]))
+
+
+def iter_matrix_series(path: str, read_chars: int = DUMP_READ_CHARS) -> Iterator[dict]:
+    """Yield the series of a range-query dump one at a time
+
+    Each element of the `result` array is decoded on its own with
+    raw_decode, so only one series (plus a read buffer) is held in memory at
+    once. `status` and `resultType` are checked wherever they appear, before
+    or after the array, and accepted when absent.
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buffer = ""
+        match = None
+        while match is None:
+            chunk = f.read(read_chars)
+            if not chunk:
+                raise ValueError(f"{path}: expected a successful matrix range-query response")
+            buffer += chunk
+            match = RESULT_ARRAY.search(buffer)
+
+        check_response_fields(path, buffer[:match.start()])
+
+        buffer, position = buffer[match.end():], 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                check_response_fields(path, buffer[position + 1:] + f.read())
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError("need more input", buffer, position)
+                series, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Incomplete series: read on, at least doubling the buffer so
+                # a series much larger than read_chars is not re-parsed often
+                chunk = f.read(max(read_chars, len(buffer) - position))
+                if not chunk:
+                    raise ValueError(f"{path}: truncated range-query response")
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield series
+
+
+def check_response_fields(path: str, text: str):
+    for pattern, expected in RESPONSE_FIELDS.items():
+        found = pattern.search(text)
+        if found and found.group(1) != expected:
+            raise ValueError(f"{path}: expected a successful matrix range-query response")
+
+
+def read_prometheus_dump(path: str, resource: str, aggregator: UsageAggregator):
+    """Stream one range-query JSON dump (resultType matrix)"""
+    for series in iter_matrix_series(path):
+        labels = series.get("metric", {})
+        container = labels.get("container") or labels.get("container_name")
+        pod = labels.get("pod") or labels.get("pod_name", "")
+        if not container or container == "POD":
+            continue
+        key = (labels.get("namespace", "default"), workload_name(pod, labels), container)
+        samples = series.get("values", [])
+        values = np.fromiter((v for _, v in samples), dtype=np.float64, count=len(samples))
+        aggregator.add_series(key, resource, values[np.isfinite(values)])
+
+
+def iter_csv_chunks(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[Tuple[int, List[str]]]]:
+    """Chunks of (line number, row); blank rows are dropped, short ones reported"""
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        expected = ["timestamp", "namespace", "pod", "container", "resource", "value"]
+        if [h.strip().lower() for h in header] != expected:
+            raise ValueError(f"{path}: expected CSV columns {','.join(expected)}")
+
+        chunk = []
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) != len(expected):
+                print(f"{path}:{reader.line_num}: skipping row with {len(row)} of {len(expected)} columns", file=sys.stderr)
+                continue
+            chunk.append((reader.line_num, row))
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def read_csv(path: str, aggregator: UsageAggregator, chunk_rows: int = CHUNK_ROWS):
+    """Stream a CSV export in chunks of `chunk_rows` rows"""
+    for chunk in iter_csv_chunks(path, chunk_rows):
+        for resource in ("cpu", "memory"):
+            key_index: Dict[WorkloadKey, int] = {}
+            key_ids = []
+            values = []
+            lines = []
+            for line, (_, namespace, pod, container, row_resource, value) in chunk:
+                if row_resource != resource:
+                    continue
+                key = (namespace, workload_name(pod), container)
+                key_ids.append(key_index.setdefault(key, len(key_index)))
+                values.append(value)
+                lines.append(line)
+            if values:
+                aggregator.add_chunk(
+                    list(key_index), np.array(key_ids, dtype=np.int64),
+                    resource, parse_values(path, values, lines)
+                )
+
+
+def parse_values(path: str, values: List[str], lines: List[int]) -> np.ndarray:
+    """Convert a chunk's values; unparseable ones become NaN (and are skipped) with a report"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        pass
+    parsed = np.empty(len(values))
+    for i, (value, line) in enumerate(zip(values, lines)):
+        try:
+            parsed[i] = float(value)
+        except ValueError:
+            print(f"{path}:{line}: skipping non-numeric value {value!r}", file=sys.stderr)
+            parsed[i] = math.nan
+    return parsed
+
+
+def parse_cpu(value) -> float:
+    text = str(value)
+    if text.endswith("m"):
+        return float(text[:-1]) / 1000
+    return float(text)
+
+
+MEMORY_UNITS = {
+    "Ki": 2 ** 10, "Mi": 2 ** 20, "Gi": 2 ** 30, "Ti": 2 ** 40,
+    "K": 10 ** 3, "M": 10 ** 6, "G": 10 ** 9, "T": 10 ** 12,
+}
+
+
+def parse_memory(value) -> float:
+    text = str(value)
+    for suffix in ("Ki", "Mi", "Gi", "Ti", "K", "M", "G", "T"):
+        if text.endswith(suffix):
+            return float(text[:-len(suffix)]) * MEMORY_UNITS[suffix]
+    return float(text)
+
+
+def format_cpu(cores: float) -> str:
+    return f"{max(5, int(math.ceil(cores * 1000 / 5) * 5))}m"
+
+
+def format_memory(size: float) -> str:
+    return f"{int(math.ceil(size / 2 ** 20))}Mi"
+
+
+def load_manifests(paths: List[str]) -> Dict[WorkloadKey, dict]:
+    """Collect declared resources and replica counts from workload manifests"""
+    if not paths:
+        return {}
+    if yaml is None:
+        raise RuntimeError("PyYAML is required to read manifests (pip install pyyaml)")
+
+    declared = {}
+    for path in paths:
+        with open(path) as f:
+            for doc in yaml.safe_load_all(f):
+                if not doc or doc.get("kind") not in ("Deployment", "StatefulSet", "DaemonSet"):
+                    continue
+                metadata = doc.get("metadata", {})
+                spec = doc.get("spec", {})
+                for container in spec.get("template", {}).get("spec", {}).get("containers", []):
+                    key = (metadata.get("namespace", "default"), metadata["name"], container["name"])
+                    declared[key] = {
+                        "kind": doc["kind"],
+                        "replicas": spec.get("replicas", 1),
+                        "resources": container.get("resources", {}),
+                        "source": path,
+                    }
+    return declared
+
+
+def recommend(profile: ContainerProfile) -> dict:
+    result = {}
+    for resource in ("cpu", "memory"):
+        hist = getattr(profile, resource)
+        if not hist.samples:
+            continue
+        percentile, request_headroom, limit_headroom = POLICY[resource]
+        floor = MIN_CPU_CORES if resource == "cpu" else MIN_MEMORY_BYTES
+        request = max(hist.percentile(percentile) * (1 + request_headroom), floor)
+        limit = max(hist.peak * (1 + limit_headroom), request)
+        result[resource] = {
+            "samples": hist.samples,
+            "mean": hist.mean,
+            "p50": hist.percentile(50),
+            "p95": hist.percentile(95),
+            "p99": hist.percentile(99),
+            "peak": hist.peak,
+            "request": request,
+            "limit": limit,
+        }
+    return result
+
+
+def build_report(
+    aggregator: UsageAggregator,
+    declared: Dict[WorkloadKey, dict],
+    cpu_price: float = DEFAULT_CPU_PRICE_PER_HOUR,
+    gib_price: float = DEFAULT_GIB_PRICE_PER_HOUR,
+) -> dict:
+    containers = []
+    total_savings = 0.0
+
+    for key in sorted(aggregator.profiles):
+        namespace, workload, container = key
+        rec = recommend(aggregator.profiles[key])
+        formatters = {"cpu": format_cpu, "memory": format_memory}
+        entry = {
+            "namespace": namespace,
+            "workload": workload,
+            "container": container,
+            "usage": {r: {k: v for k, v in rec[r].items() if k not in ("request", "limit")} for r in rec},
+            "recommended": {
+                "requests": {r: formatters[r](rec[r]["request"]) for r in rec},
+                "limits": {r: formatters[r](rec[r]["limit"]) for r in rec},
+            },
+        }
+
+        manifest = declared.get(key)
+        if manifest:
+            requests = manifest["resources"].get("requests", {})
+            replicas = manifest["replicas"]
+            parsers = {"cpu": parse_cpu, "memory": parse_memory}
+            unit_prices = {"cpu": cpu_price, "memory": gib_price / 2 ** 30}
+
+            monthly = 0.0
+            utilization = {}
+            for resource in rec:
+                if resource not in requests:
+                    continue
+                current = parsers[resource](requests[resource])
+                recommended = parsers[resource](entry["recommended"]["requests"][resource])
+                monthly += (current - recommended) * unit_prices[resource] * HOURS_PER_MONTH * replicas
+                utilization[resource] = rec[resource]["mean"] / current
+
+            entry["current"] = {"replicas": replicas, "resources": manifest["resources"], "source": manifest["source"]}
+            entry["utilization"] = {
+                r: {"actual": round(u, 3), "target": UTILIZATION_TARGETS[r], "meets_target": u >= UTILIZATION_TARGETS[r]}
+                for r, u in utilization.items()
+            }
+            entry["projected_monthly_savings"] = round(monthly, 2)
+            entry["patch"] = {
+                "kind": manifest["kind"],
+                "name": workload,
+                "namespace": namespace,
+                "strategic_merge_patch": {
+                    "spec": {"template": {"spec": {"containers": [
+                        {"name": container, "resources": entry["recommended"]}
+                    ]}}}
+                },
+            }
+            total_savings += monthly
+
+        containers.append(entry)
+
+    return {
+        "pricing": {"cpu_per_hour": cpu_price, "gib_per_hour": gib_price, "hours_per_month": HOURS_PER_MONTH},
+        "containers": containers,
+        "total_projected_monthly_savings": round(total_savings, 2),
+    }
+
+
+def print_report(report: dict):
+    print(f"{'CONTAINER':<50} {'CPU p95':>9} {'CPU req':>9} {'MEM p99':>9} {'MEM req':>9} {'SAVINGS/mo':>11}")
+    for entry in report["containers"]:
+        name = f"{entry['namespace']}/{entry['workload']}/{entry['container']}"
+        savings = entry.get("projected_monthly_savings")
+        usage = entry["usage"]
+        requests = entry["recommended"]["requests"]
+        cpu_p95 = format_cpu(usage["cpu"]["p95"]) if "cpu" in usage else "-"
+        memory_p99 = format_memory(usage["memory"]["p99"]) if "memory" in usage else "-"
+        print(
+            f"{name[:50]:<50} "
+            f"{cpu_p95:>9} {requests.get('cpu', '-'):>9} "
+            f"{memory_p99:>9} {requests.get('memory', '-'):>9} "
+            f"{'n/a' if savings is None else f'${savings:,.2f}':>11}"
+        )
+    print(f"\nTotal projected monthly savings: ${report['total_projected_monthly_savings']:,.2f}")
+
+    for entry in report["containers"]:
+        if "patch" in entry:
+            patch = entry["patch"]
+            print(
+                f"kubectl patch {patch['kind'].lower()} {patch['name']} -n {patch['namespace']} "
+                f"--type strategic -p '{json.dumps(patch['strategic_merge_patch'])}'"
+            )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Recommend container requests/limits from usage history")
+    parser.add_argument("--cpu", nargs="*", default=[], help="Prometheus range-query dumps of CPU usage in cores")
+    parser.add_argument("--memory", nargs="*", default=[], help="Prometheus range-query dumps of memory working set in bytes")
+    parser.add_argument("--csv", nargs="*", default=[], help="CSV exports: timestamp,namespace,pod,container,resource,value")
+    parser.add_argument("--manifests", nargs="*", default=[], help="Kubernetes manifests with current requests")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="CSV rows per processing chunk")
+    parser.add_argument("--cpu-price", type=float, default=DEFAULT_CPU_PRICE_PER_HOUR, help="USD per vCPU-hour")
+    parser.add_argument("--gib-price", type=float, default=DEFAULT_GIB_PRICE_PER_HOUR, help="USD per GiB-hour")
+    parser.add_argument("--output", help="Write the full JSON report here")
+    args = parser.parse_args(argv)
+
+    if not (args.cpu or args.memory or args.csv):
+        parser.error("provide at least one of --cpu, --memory or --csv")
+
+    aggregator = UsageAggregator()
+    for path in args.cpu:
+        read_prometheus_dump(path, "cpu", aggregator)
+    for path in args.memory:
+        read_prometheus_dump(path, "memory", aggregator)
+    for path in args.csv:
+        read_csv(path, aggregator, args.chunk_rows)
+
+    report = build_report(aggregator, load_manifests(args.manifests), args.cpu_price, args.gib_price)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
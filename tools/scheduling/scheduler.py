@@ -0,0 +1,485 @@
+"""Cost-aware capacity planner for batch jobs on Spot/On-Demand node pools.
+
+Given a job set (CPU, memory and duration per batch) and a catalog of node
+types with On-Demand and Spot prices and interruption rates, finds the
+cheapest node pool that finishes every job before a deadline with the
+requested probability.
+
+Jobs are grouped by resource shape. A node of a given type runs as many
+jobs of one shape side by side as fit its allocatable CPU and memory
+("lanes"), and each lane works through its queue back to back, as a batch
+worker replica does. For every node type and On-Demand share:
+
+1. Jobs are dealt to lanes longest first in serpentine order, which balances
+   lane loads to within one job duration like LPT but is a single numpy
+   pass, so tens of thousands of jobs are placed in milliseconds.
+2. A binary search finds the fewest nodes that meet the deadline without
+   interruptions.
+3. Spot interruptions are simulated Monte-Carlo (exponential arrivals per
+   node, 2-minute notice, jobs in flight restarted on the replacement node)
+   and nodes are added until the deadline is met in `--confidence` of the
+   trials.
+
+The cheapest candidate by expected cost wins. Its lane queues can be written
+out with --queue-file and read by the batch worker (BATCH_ORDER_FILE) so
+each replica processes its share of batches in plan order.
+
+Examples:
+    # The batch worker's own jobs: MAX_ITERATIONS batches of BATCH_SIZE,
+    # each taking 2-4 minutes, to be done within 2 hours
+    python scheduler.py --jobs 20000 --duration-scale 60 --deadline 7200
+
+    # CSV with columns id,cpu,memory_gib,duration_seconds and a measured catalog
+    python scheduler.py --jobs-csv jobs.csv --catalog nodes.json \\
+        --output plan.json --queue-file batch-order.json
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class NodeType:
+    name: str
+    vcpu: float
+    memory_gib: float
+    on_demand_price: float  # USD per hour
+    spot_price: float  # USD per hour
+    interruptions_per_hour: float  # Spot only
+
+
+# Instance types allowed by platform/spot-provisioning/karpenter.yaml with
+# us-east-1 Linux list prices and typical Spot prices. Interruption rates are
+# per node-hour and deliberately pessimistic next to the Spot Instance
+# Advisor's monthly frequencies; load measured values with --catalog.
+NODE_CATALOG = [
+    NodeType("c5.large", 2, 4, 0.085, 0.035, 0.02),
+    NodeType("c5.xlarge", 4, 8, 0.170, 0.070, 0.02),
+    NodeType("m5.large", 2, 8, 0.096, 0.038, 0.01),
+    NodeType("m5.xlarge", 4, 16, 0.192, 0.077, 0.01),
+    NodeType("c5a.large", 2, 4, 0.077, 0.032, 0.03),
+    NodeType("c5a.xlarge", 4, 8, 0.154, 0.065, 0.03),
+]
+
+# Held back from every node for kubelet, kube-proxy and the CNI: (vCPU, GiB)
+SYSTEM_RESERVED = (0.1, 0.6)
+
+# spot-nodepool limits in karpenter.yaml: (vCPU, GiB)
+SPOT_POOL_LIMITS = (1000.0, 1000.0)
+
+NODE_STARTUP_SECONDS = 90.0  # launch, join and image pull; also a replacement's lead time
+INTERRUPTION_NOTICE_SECONDS = 120.0
+CONSOLIDATE_AFTER_SECONDS = 30.0  # karpenter WhenEmpty consolidation
+MIN_BILLED_SECONDS = 60.0
+MAX_INTERRUPTIONS = 8  # per node per trial; further ones are vanishingly rare
+
+ON_DEMAND_SHARES = (0.0, 0.25, 0.5, 1.0)
+HEADROOM_STEP = 0.05  # grow Spot plans by 5% of the interruption-free node count
+MAX_HEADROOM = 1.0
+MAX_SIMULATED_LANES = 2_000_000  # trials x lanes per Monte-Carlo chunk
+
+
+@dataclass
+class JobSet:
+    ids: np.ndarray
+    cpu: np.ndarray
+    memory_gib: np.ndarray
+    duration: np.ndarray  # seconds
+
+    def shapes(self) -> List[Tuple[float, float, np.ndarray]]:
+        """(cpu, memory_gib, row indices) per distinct resource shape"""
+        pairs = np.stack([self.cpu, self.memory_gib], axis=1)
+        unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        return [(float(cpu), float(memory), np.flatnonzero(inverse == i)) for i, (cpu, memory) in enumerate(unique)]
+
+
+def job_shape(batch_size: int) -> Tuple[float, float]:
+    """Requests for one batch: half a core, 512Mi runtime plus 16Mi per sample"""
+    return 0.5, 0.5 + batch_size * 16 / 1024
+
+
+def worker_jobs(iterations: int, batch_size: int, duration_scale: float = 1.0) -> JobSet:
+    """The batch worker's batches, timed like BatchWorker.process_batch"""
+    ids = np.arange(iterations, dtype=np.int64)
+    cpu, memory = job_shape(batch_size)
+    return JobSet(
+        ids=ids,
+        cpu=np.full(iterations, cpu),
+        memory_gib=np.full(iterations, memory),
+        duration=(2 + ids % 3) * float(duration_scale),
+    )
+
+
+def read_jobs_csv(path: str) -> JobSet:
+    expected = ["id", "cpu", "memory_gib", "duration_seconds"]
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if [h.strip().lower() for h in header] != expected:
+            raise ValueError(f"{path}: expected CSV columns {','.join(expected)}")
+        rows = [row for row in reader if row]
+    if not rows:
+        raise ValueError(f"{path}: no jobs")
+    columns = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    if not np.isfinite(columns).all():
+        raise ValueError(f"{path}: values must be finite")
+    if (columns[:, 1:3] <= 0).any():
+        raise ValueError(f"{path}: cpu and memory_gib must be positive")
+    if (columns[:, 3] < 0).any():
+        raise ValueError(f"{path}: duration_seconds must not be negative")
+    return JobSet(
+        ids=columns[:, 0].astype(np.int64),
+        cpu=columns[:, 1],
+        memory_gib=columns[:, 2],
+        duration=columns[:, 3],
+    )
+
+
+def load_catalog(path: str) -> List[NodeType]:
+    """JSON list of objects with the NodeType fields"""
+    with open(path) as f:
+        return [NodeType(**entry) for entry in json.load(f)]
+
+
+def lanes_per_node(node: NodeType, cpu: float, memory_gib: float) -> int:
+    return max(0, int(min(
+        (node.vcpu - SYSTEM_RESERVED[0]) / cpu,
+        (node.memory_gib - SYSTEM_RESERVED[1]) / memory_gib,
+    )))
+
+
+def assign_lanes(duration: np.ndarray, lanes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Deal jobs longest first in serpentine order
+
+    Returns the job order and the lane of each job in that order. Every
+    round hands the lanes that got the longest jobs the shortest ones next,
+    so lane loads end up within one job duration of each other.
+    """
+    order = np.argsort(-duration, kind="stable")
+    position = np.arange(len(order))
+    column = position % lanes
+    lane = np.where((position // lanes) % 2 == 0, column, lanes - 1 - column)
+    return order, lane
+
+
+def lane_loads(duration: np.ndarray, lanes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Total and mean job duration per lane"""
+    order, lane = assign_lanes(duration, lanes)
+    loads = np.bincount(lane, weights=duration[order], minlength=lanes)
+    counts = np.bincount(lane, minlength=lanes)
+    return loads, loads / np.maximum(counts, 1)
+
+
+def min_nodes(duration: np.ndarray, per_node: int, deadline: float) -> Optional[int]:
+    """Fewest nodes that finish by the deadline without interruptions"""
+    budget = deadline - NODE_STARTUP_SECONDS
+    longest = float(duration.max())
+    if budget < longest:
+        return None
+    work = float(duration.sum())
+    max_nodes = math.ceil(len(duration) / per_node)
+    low = max(1, math.ceil(work / (per_node * budget)))
+    if budget > longest:
+        # Serpentine lanes finish within one job of the mean load
+        # At least one node, even when every job takes no time
+        high = max(1, min(max_nodes, math.ceil(work / (per_node * (budget - longest)))))
+    else:
+        high = max_nodes
+    low = min(low, high)
+    while low < high:
+        middle = (low + high) // 2
+        if lane_loads(duration, middle * per_node)[0].max() <= budget:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def simulate_spot(
+    loads: np.ndarray,
+    mean_job: np.ndarray,
+    interruptions_per_hour: float,
+    trials: int,
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Monte-Carlo finish times of Spot nodes
+
+    `loads` and `mean_job` are (nodes, lanes per node). On each interruption
+    a lane whose job in flight can finish within the notice keeps it and
+    resumes on the replacement node; otherwise the job restarts there and
+    its progress is lost. The replacement is launched at the notice and
+    ready NODE_STARTUP_SECONDS later. Returns per trial and node the busy
+    seconds after startup, the billed seconds and the interruption count.
+    """
+    nodes, per_node = loads.shape
+    mean_gap = 3600.0 / interruptions_per_hour if interruptions_per_hour > 0 else math.inf
+    elapsed = np.zeros((trials, nodes))
+    remaining = np.broadcast_to(loads, (trials, nodes, per_node)).copy()
+    interruptions = np.zeros((trials, nodes), dtype=np.int64)
+
+    for _ in range(MAX_INTERRUPTIONS if math.isfinite(mean_gap) else 0):
+        node_remaining = remaining.max(axis=2)
+        gap = rng.exponential(mean_gap, size=(trials, nodes))
+        hit = gap < node_remaining
+        if not hit.any():
+            break
+        elapsed += np.where(hit, gap, node_remaining)
+        remaining = np.where(hit[..., None], np.maximum(remaining - gap[..., None], 0.0), 0.0)
+
+        in_flight = mean_job * rng.random(size=remaining.shape)
+        left = mean_job - in_flight
+        delay = np.where(
+            left <= INTERRUPTION_NOTICE_SECONDS,
+            np.maximum(NODE_STARTUP_SECONDS - left, 0.0),
+            NODE_STARTUP_SECONDS + in_flight,
+        )
+        remaining += np.where(remaining > 0, delay, 0.0)
+        interruptions += hit
+
+    elapsed += remaining.max(axis=2)
+    billed = np.maximum(
+        NODE_STARTUP_SECONDS + elapsed + CONSOLIDATE_AFTER_SECONDS + interruptions * INTERRUPTION_NOTICE_SECONDS,
+        MIN_BILLED_SECONDS,
+    )
+    return elapsed, billed, interruptions
+
+
+def evaluate(
+    duration: np.ndarray,
+    node: NodeType,
+    per_node: int,
+    nodes: int,
+    on_demand: int,
+    deadline: float,
+    trials: int,
+    rng: np.random.Generator,
+) -> dict:
+    """Makespan distribution and cost of `nodes` nodes, the first `on_demand` of them On-Demand"""
+    loads, mean_job = lane_loads(duration, nodes * per_node)
+    loads = loads.reshape(nodes, per_node)
+    mean_job = mean_job.reshape(nodes, per_node)
+    spot = nodes - on_demand
+
+    on_demand_busy = loads[:on_demand].max(axis=1)
+    on_demand_finish = NODE_STARTUP_SECONDS + (on_demand_busy.max() if on_demand else 0.0)
+    on_demand_cost = node.on_demand_price / 3600 * np.maximum(
+        NODE_STARTUP_SECONDS + on_demand_busy + CONSOLIDATE_AFTER_SECONDS, MIN_BILLED_SECONDS
+    ).sum()
+
+    if spot:
+        finish, cost, interruptions = [], [], []
+        chunk = max(1, MAX_SIMULATED_LANES // (spot * per_node))
+        for first in range(0, trials, chunk):
+            busy, billed, hits = simulate_spot(
+                loads[on_demand:], mean_job[on_demand:], node.interruptions_per_hour, min(chunk, trials - first), rng
+            )
+            finish.append(np.maximum(NODE_STARTUP_SECONDS + busy.max(axis=1), on_demand_finish))
+            cost.append(on_demand_cost + node.spot_price / 3600 * billed.sum(axis=1))
+            interruptions.append(hits.sum(axis=1))
+        finish, cost, interruptions = np.concatenate(finish), np.concatenate(cost), np.concatenate(interruptions)
+    else:
+        finish, cost, interruptions = np.array([on_demand_finish]), np.array([on_demand_cost]), np.zeros(1)
+
+    return {
+        "node_type": node.name,
+        "nodes": nodes,
+        "on_demand_nodes": on_demand,
+        "spot_nodes": spot,
+        "lanes_per_node": per_node,
+        "makespan_seconds": {
+            "no_interruptions": round(NODE_STARTUP_SECONDS + float(loads.max()), 1),
+            "p50": round(float(np.percentile(finish, 50)), 1),
+            "p95": round(float(np.percentile(finish, 95)), 1),
+        },
+        "deadline_probability": round(float((finish <= deadline).mean()), 4),
+        "interruptions_mean": round(float(interruptions.mean()), 2),
+        "expected_cost": round(float(cost.mean()), 4),
+        "cost_p95": round(float(np.percentile(cost, 95)), 4),
+    }
+
+
+def within_spot_limits(node: NodeType, spot_nodes: int) -> bool:
+    return spot_nodes * node.vcpu <= SPOT_POOL_LIMITS[0] and spot_nodes * node.memory_gib <= SPOT_POOL_LIMITS[1]
+
+
+def plan_shape(
+    duration: np.ndarray,
+    cpu: float,
+    memory_gib: float,
+    catalog: Sequence[NodeType],
+    deadline: float,
+    confidence: float,
+    trials: int,
+    on_demand_shares: Sequence[float],
+    rng: np.random.Generator,
+) -> List[dict]:
+    """Cheapest plan per (node type, On-Demand share) meeting the deadline, by expected cost"""
+    candidates = []
+    seen = set()
+    for node in catalog:
+        per_node = lanes_per_node(node, cpu, memory_gib)
+        if not per_node:
+            continue
+        base = min_nodes(duration, per_node, deadline)
+        if base is None:
+            continue
+        step = max(1, math.ceil(base * HEADROOM_STEP))
+        for share in on_demand_shares:
+            nodes = base
+            while nodes <= base * (1 + MAX_HEADROOM):
+                on_demand = min(nodes, int(round(nodes * share)))
+                if (node.name, on_demand, nodes) in seen or not within_spot_limits(node, nodes - on_demand):
+                    break
+                seen.add((node.name, on_demand, nodes))
+                result = evaluate(duration, node, per_node, nodes, on_demand, deadline, trials, rng)
+                if result["deadline_probability"] >= confidence:
+                    candidates.append(result)
+                    break
+                if on_demand == nodes:
+                    break
+                nodes += step
+    return sorted(candidates, key=lambda c: c["expected_cost"])
+
+
+def lane_queues(jobs: JobSet, groups: List[dict]) -> Dict[str, List[int]]:
+    """Batch ids per worker for the chosen plans, longest first, workers numbered across groups"""
+    queues: Dict[str, List[int]] = {}
+    for group in groups:
+        plan = group["plan"]
+        rows = group["rows"]
+        order, lane = assign_lanes(jobs.duration[rows], plan["nodes"] * plan["lanes_per_node"])
+        ids = jobs.ids[rows][order]
+        offset = len(queues)
+        for index in range(plan["nodes"] * plan["lanes_per_node"]):
+            queues[f"worker-{offset + index + 1}"] = ids[lane == index].tolist()
+    return queues
+
+
+def build_plan(
+    jobs: JobSet,
+    catalog: Sequence[NodeType],
+    deadline: float,
+    confidence: float = 0.95,
+    trials: int = 1000,
+    on_demand_shares: Sequence[float] = ON_DEMAND_SHARES,
+    seed: int = 0,
+) -> dict:
+    rng = np.random.default_rng(seed)
+    groups = []
+    for cpu, memory_gib, rows in jobs.shapes():
+        duration = jobs.duration[rows]
+        candidates = plan_shape(
+            duration, cpu, memory_gib, catalog, deadline, confidence, trials, on_demand_shares, rng
+        )
+        on_demand_only = [c for c in candidates if c["spot_nodes"] == 0]
+        groups.append({
+            "shape": {"cpu": cpu, "memory_gib": memory_gib},
+            "jobs": len(rows),
+            "work_hours": round(float(duration.sum()) / 3600, 2),
+            "plan": candidates[0] if candidates else None,
+            "on_demand_cost": on_demand_only[0]["expected_cost"] if on_demand_only else None,
+            "alternatives": candidates[1:6],
+            "rows": rows,
+        })
+
+    chosen = [g["plan"] for g in groups if g["plan"]]
+    feasible = len(chosen) == len(groups)
+    spot_vcpu = sum(p["spot_nodes"] * next(n.vcpu for n in catalog if n.name == p["node_type"]) for p in chosen)
+    spot_memory = sum(p["spot_nodes"] * next(n.memory_gib for n in catalog if n.name == p["node_type"]) for p in chosen)
+    return {
+        "deadline_seconds": deadline,
+        "confidence": confidence,
+        "trials": trials,
+        "catalog": [asdict(n) for n in catalog],
+        "groups": groups,
+        "feasible": feasible,
+        "total": {
+            "expected_cost": round(sum(p["expected_cost"] for p in chosen), 4),
+            "on_demand_cost": round(sum(g["on_demand_cost"] or 0.0 for g in groups), 4),
+            # Groups are simulated independently
+            "deadline_probability": round(float(np.prod([p["deadline_probability"] for p in chosen])), 4) if feasible else 0.0,
+            "nodes": sum(p["nodes"] for p in chosen),
+            "within_spot_pool_limits": spot_vcpu <= SPOT_POOL_LIMITS[0] and spot_memory <= SPOT_POOL_LIMITS[1],
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"{'SHAPE':<16} {'NODE TYPE':<11} {'OD/SPOT':>9} {'P(DEADLINE)':>11} {'P95 MAKESPAN':>12} {'COST':>10} {'OD COST':>10}")
+    for group in report["groups"]:
+        shape = f"{group['shape']['cpu']:g}cpu/{group['shape']['memory_gib']:g}Gi x{group['jobs']}"
+        rows = [group["plan"]] + group["alternatives"] if group["plan"] else []
+        if not rows:
+            print(f"{shape:<16} no plan meets the deadline")
+        for i, plan in enumerate(rows):
+            od_cost = group["on_demand_cost"]
+            print(
+                f"{shape if i == 0 else '  alternative':<16} {plan['node_type']:<11} "
+                f"{plan['on_demand_nodes']:>4}/{plan['spot_nodes']:<4} "
+                f"{plan['deadline_probability']:>11.3f} {plan['makespan_seconds']['p95']:>11.0f}s "
+                f"{'$' + format(plan['expected_cost'], ',.3f'):>10} "
+                f"{('$' + format(od_cost, ',.3f')) if i == 0 and od_cost is not None else '':>10}"
+            )
+
+    total = report["total"]
+    if not report["feasible"]:
+        print("\nSome jobs cannot finish before the deadline on any node type")
+    print(
+        f"\nExpected cost ${total['expected_cost']:,.3f} on {total['nodes']} nodes "
+        f"(all On-Demand ${total['on_demand_cost']:,.3f}), "
+        f"P(deadline) {total['deadline_probability']:.3f}"
+    )
+    if not total["within_spot_pool_limits"]:
+        print("Warning: the Spot nodes exceed the spot-nodepool limits in karpenter.yaml")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Plan the cheapest Spot/On-Demand capacity for a batch job set")
+    parser.add_argument("--jobs", type=int, default=int(os.getenv("MAX_ITERATIONS", "100")), help="Batches to plan (default MAX_ITERATIONS)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("BATCH_SIZE", "32")), help="Samples per batch (default BATCH_SIZE)")
+    parser.add_argument("--duration-scale", type=float, default=1.0, help="Multiplier on process_batch's 2-4s batch durations")
+    parser.add_argument("--jobs-csv", help="CSV with columns id,cpu,memory_gib,duration_seconds instead of the worker's batches")
+    parser.add_argument("--catalog", help="JSON node catalog (default: the karpenter.yaml instance types)")
+    parser.add_argument("--deadline", type=float, default=3600.0, help="Seconds to finish every job in")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Required probability of meeting the deadline")
+    parser.add_argument("--trials", type=int, default=1000, help="Monte-Carlo interruption trials per candidate")
+    parser.add_argument("--on-demand-shares", default=",".join(str(s) for s in ON_DEMAND_SHARES), help="On-Demand node shares to try")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the full JSON plan here")
+    parser.add_argument("--queue-file", help="Write per-worker batch order here for the batch worker's BATCH_ORDER_FILE")
+    args = parser.parse_args(argv)
+
+    jobs = read_jobs_csv(args.jobs_csv) if args.jobs_csv else worker_jobs(args.jobs, args.batch_size, args.duration_scale)
+    if not len(jobs.ids):
+        parser.error("no jobs to plan")
+    catalog = load_catalog(args.catalog) if args.catalog else NODE_CATALOG
+    shares = [float(s) for s in args.on_demand_shares.split(",") if s.strip()]
+
+    report = build_plan(jobs, catalog, args.deadline, args.confidence, args.trials, shares, args.seed)
+    print_report(report)
+
+    if args.queue_file and report["feasible"]:
+        queues = lane_queues(jobs, report["groups"])
+        with open(args.queue_file, "w") as f:
+            json.dump(queues, f)
+        print(f"\nQueue order for {len(queues)} workers written to {args.queue_file}")
+
+    for group in report["groups"]:
+        del group["rows"]
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nPlan written to {args.output}")
+    return 0 if report["feasible"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())